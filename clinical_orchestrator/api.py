@@ -2,185 +2,353 @@
 FastAPI Backend for DocWeaver Frontend Integration
 Provides RESTful API endpoints for the Next.js frontend
 """
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple, Union
+from contextlib import asynccontextmanager
 import os
-import tempfile
 import asyncio
+import hashlib
 from datetime import datetime
-import traceback
+import logging
+
+import aiofiles
+import aiofiles.os
+import orjson
+
+from orchestrator import DocWeaverOrchestrator, shutdown_extractor_pool
+from document_processor import extract_text_from_file, shutdown_gemini_executor
+from config import Config, configure_logging
+from llm_cache import llm_cache, prompt_cache, semantic_cache, make_cache_key
+from sessions import sessions, DEFAULT_SESSION_ID
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response serialized with orjson, several times faster than stdlib json"""
+    
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Release process-wide resources when the server stops"""
+    yield
+    shutdown_extractor_pool()
+    shutdown_gemini_executor()
 
-from orchestrator import DocWeaverOrchestrator
-from document_processor import extract_text_from_file
-from config import Config
 
 app = FastAPI(
     title="DocWeaver API",
     description="Clinical Intelligence Platform API powered by Gemini 3",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
+
+class RequestTimestampMiddleware:
+    """Stamp each HTTP request once with its ISO start time, read as request.state.ts"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            scope.setdefault("state", {})["ts"] = datetime.now().isoformat()
+        await self.app(scope, receive, send)
+
+
+# Added before CORS so it sits inside it and preflight requests skip it
+app.add_middleware(RequestTimestampMiddleware)
+
 # Enable CORS for frontend
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=[
-        "http://localhost:3000",
-        "http://localhost:3001",
-        "http://127.0.0.1:3000",
-        "http://127.0.0.1:3001",
-        "https://your-vercel-app.vercel.app"  # Add your Vercel URL here
-    ],
+    # Local dev servers on ports 3000/3001, plus the deployed frontend
+    allow_origin_regex=(
+        r"https?://(localhost|127\.0\.0\.1):300[01]"
+        r"|https://your-vercel-app\.vercel\.app"  # Add your Vercel URL here
+    ),
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    max_age=86400,  # Let browsers cache preflight responses for a day
 )
 
-# Initialize orchestrator
-orchestrator = DocWeaverOrchestrator()
+# In-flight complete workflows keyed by payload hash, so concurrent
+# identical requests share a single pipeline run (single-flight)
+_inflight_workflows: Dict[str, asyncio.Task] = {}
+
+# Uploads are streamed to disk in fixed-size chunks so memory stays bounded
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
+
+
+async def _spool_upload(file: UploadFile, digest=None) -> Union[str, Tuple[str, bytes]]:
+    """
+    Read an uploaded file in chunks
+    Small files stay in memory and are returned as (file_name, content);
+    files larger than FILE_SIZE_MB_THRESHOLD are streamed to a temporary
+    file and its path is returned instead
+    If a hashlib digest is given, it is updated with the file content
+    Raises HTTP 413 as soon as the file exceeds MAX_UPLOAD_MB
+    """
+    file_name = file.filename or 'upload.txt'
+    threshold = Config.FILE_SIZE_MB_THRESHOLD * 1024 * 1024
+    max_size = Config.MAX_UPLOAD_MB * 1024 * 1024
+    too_large = HTTPException(
+        status_code=413,
+        detail=f"{file_name} exceeds the {Config.MAX_UPLOAD_MB} MB upload limit"
+    )
+    
+    if file.size is not None and file.size > max_size:
+        raise too_large
+    
+    chunks = []
+    size = 0
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        if digest is not None:
+            digest.update(chunk)
+        chunks.append(chunk)
+        size += len(chunk)
+        if size > max_size:
+            raise too_large
+        if size > threshold:
+            break
+    else:
+        return (file_name, b"".join(chunks))
+    
+    # Too large to keep in memory - spill what we have and stream the rest
+    suffix = os.path.splitext(file_name)[1] or '.txt'
+    async with aiofiles.tempfile.NamedTemporaryFile('wb', delete=False, suffix=suffix) as temp_file:
+        try:
+            for chunk in chunks:
+                await temp_file.write(chunk)
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                if digest is not None:
+                    digest.update(chunk)
+                size += len(chunk)
+                if size > max_size:
+                    raise too_large
+                await temp_file.write(chunk)
+        except BaseException:
+            await _remove_temp_files([temp_file.name])
+            raise
+    return temp_file.name
+
+
+async def _spool_uploads(files: List[UploadFile], digests: list) -> list:
+    """
+    Spool all uploads concurrently
+    If any upload fails, temp files already written for the others are removed
+    """
+    uploads = await asyncio.gather(
+        *(_spool_upload(file, digest) for file, digest in zip(files, digests)),
+        return_exceptions=True
+    )
+    errors = [upload for upload in uploads if isinstance(upload, BaseException)]
+    if errors:
+        await _remove_temp_files([upload for upload in uploads if isinstance(upload, str)])
+        raise errors[0]
+    return uploads
+
+
+async def _remove_temp_files(temp_files: List[str]) -> None:
+    """Delete temporary upload files without blocking the event loop"""
+    results = await asyncio.gather(
+        *(aiofiles.os.unlink(temp_file) for temp_file in temp_files),
+        return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            logger.warning("Could not delete temp file: %s", result)
+
+
+async def _run_workflow(orchestrator: DocWeaverOrchestrator, uploads: list, brief_note: str,
+                        temp_files: List[str]) -> Dict[str, Any]:
+    """Run the complete workflow and clean up the temp files it was given"""
+    try:
+        return await orchestrator.run_complete_workflow(uploads, brief_note)
+    finally:
+        await _remove_temp_files(temp_files)
+
+
+# Demo directory listings by path, as (directory mtime_ns, supported files)
+_demo_file_listings: Dict[str, Tuple[int, Tuple[str, ...]]] = {}
+
+
+async def _list_demo_files(mtime_ns: int, path: str) -> Tuple[str, ...]:
+    """
+    Scan a demo directory for supported files without blocking the event loop
+    Keyed on the directory mtime so the listing is refreshed when files change
+    """
+    cached = _demo_file_listings.get(path)
+    if cached is not None and cached[0] == mtime_ns:
+        return cached[1]
+    files = tuple(f for f in await aiofiles.os.listdir(path) if f.endswith(('.txt', '.pdf', '.docx')))
+    _demo_file_listings[path] = (mtime_ns, files)
+    return files
 
 
 # API Endpoints
 
+# Static parts of the health responses, built once since probes hit them constantly
+_ROOT_STATIC = {
+    "status": "healthy",
+    "service": "DocWeaver API",
+    "version": "1.0.0",
+    "model": Config.GEMINI_MODEL,
+    "docs": "/docs"
+}
+
+_HEALTH_STATIC = {
+    "status": "healthy",
+    "version": "1.0.0",
+    "model": Config.GEMINI_MODEL,
+    "api_key_configured": bool(Config.GEMINI_API_KEY)
+}
+
+
 @app.get("/")
-async def root():
+async def root(request: Request):
     """Root endpoint - Health check"""
-    return {
-        "status": "healthy",
-        "service": "DocWeaver API",
-        "version": "1.0.0",
-        "timestamp": datetime.now().isoformat(),
-        "model": Config.GEMINI_MODEL,
-        "docs": "/docs"
-    }
+    return ORJSONResponse(content={**_ROOT_STATIC, "timestamp": request.state.ts})
 
 
 @app.get("/api/health")
-async def health_check():
+async def health_check(request: Request):
     """Detailed health check endpoint"""
-    return {
-        "status": "healthy",
-        "timestamp": datetime.now().isoformat(),
-        "version": "1.0.0",
-        "model": Config.GEMINI_MODEL,
-        "api_key_configured": bool(Config.GEMINI_API_KEY),
+    return ORJSONResponse(content={
+        **_HEALTH_STATIC,
+        "timestamp": request.state.ts,
         "total_api_calls": Config.get_api_call_count()
-    }
+    })
 
 
 @app.post("/api/workflow/complete")
-async def complete_workflow(files: List[UploadFile] = File(...)):
+async def complete_workflow(files: List[UploadFile] = File(...), x_session_id: Optional[str] = Header(None)):
     """
     Complete workflow: Process documents + generate documentation + coordinate care
     This is the main endpoint the frontend uses
     """
     try:
-        print(f"\n{'='*80}")
-        print(f"🚀 COMPLETE WORKFLOW STARTED")
-        print(f"{'='*80}")
-        print(f"Files received: {len(files)}")
-        for file in files:
-            print(f"  - {file.filename} ({file.content_type})")
-        
-        # Save uploaded files temporarily
-        temp_files = []
-        for file in files:
-            suffix = os.path.splitext(file.filename)[1] or '.txt'
-            with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, mode='wb') as temp_file:
-                content = await file.read()
-                temp_file.write(content)
-                temp_files.append(temp_file.name)
-                print(f"  ✓ Saved: {file.filename} -> {temp_file.name}")
+        orchestrator = sessions.get(x_session_id or DEFAULT_SESSION_ID)
+        
+        logger.info("Complete workflow started with %d files: %s",
+                    len(files), ", ".join(f"{file.filename} ({file.content_type})" for file in files))
+        
+        # Save uploaded files temporarily, hashing content for the single-flight key
+        digests = [hashlib.sha256() for _ in files]
+        uploads = await _spool_uploads(files, digests)
+        temp_files = [upload for upload in uploads if isinstance(upload, str)]
+        if logger.isEnabledFor(logging.DEBUG):
+            for file, upload in zip(files, uploads):
+                logger.debug("Saved %s -> %s", file.filename, upload if isinstance(upload, str) else "memory")
         
         # Default brief note for documentation generation
         brief_note = "Patient follow-up visit. Review recent test results and clinical data. Update treatment plan based on findings."
         
-        print(f"\n📊 Processing workflow...")
+        workflow_key = make_cache_key({
+            "session_id": x_session_id or DEFAULT_SESSION_ID,
+            "brief_note": brief_note,
+            "files": [[file.filename, digest.hexdigest()] for file, digest in zip(files, digests)]
+        })
         
-        # Run complete workflow
-        results = await orchestrator.run_complete_workflow(temp_files, brief_note)
+        # Run complete workflow, or join an identical one already running
+        task = _inflight_workflows.get(workflow_key)
+        if task is None:
+            logger.info("Processing workflow")
+            task = asyncio.ensure_future(_run_workflow(orchestrator, uploads, brief_note, temp_files))
+            _inflight_workflows[workflow_key] = task
+            task.add_done_callback(lambda _: _inflight_workflows.pop(workflow_key, None))
+        else:
+            logger.info("Identical workflow already running - sharing its result")
+            await _remove_temp_files(temp_files)
         
-        # Clean up temp files
-        for temp_file in temp_files:
-            try:
-                os.unlink(temp_file)
-            except Exception as e:
-                print(f"  ⚠️  Could not delete temp file: {e}")
+        # Shield so a disconnecting client doesn't cancel the run for other waiters
+        results = await asyncio.shield(task)
         
-        print(f"\n{'='*80}")
-        print(f"✅ WORKFLOW COMPLETE")
-        print(f"{'='*80}")
-        print(f"Total API calls: {results['summary']['total_api_calls']}")
-        print(f"Processing time: {results['summary']['processing_time_seconds']:.1f}s")
-        print(f"Documents: {results['summary']['documents_processed']}")
-        print(f"Actions: {results['summary']['actions_automated']}")
-        print(f"{'='*80}\n")
+        summary = results['summary']
+        logger.info("Workflow complete: %s API calls, %.1fs, %s documents, %s actions",
+                    summary['total_api_calls'], summary['processing_time_seconds'],
+                    summary['documents_processed'], summary['actions_automated'])
         
-        return JSONResponse(content=results)
+        return ORJSONResponse(content=results)
     
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"\n{'='*80}")
-        print(f"❌ ERROR IN WORKFLOW")
-        print(f"{'='*80}")
-        print(f"Error: {str(e)}")
-        traceback.print_exc()
-        print(f"{'='*80}\n")
+        logger.exception("Error in complete_workflow: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/api/workflow/documents")
-async def process_documents(files: List[UploadFile] = File(...)):
+async def process_documents(files: List[UploadFile] = File(...), x_session_id: Optional[str] = Header(None)):
     """
     Feature 2: Multi-Source Data Fusion
     Process multiple documents and perform temporal analysis
     """
     try:
-        print(f"\n📊 Processing {len(files)} documents for data fusion")
+        orchestrator = sessions.get(x_session_id or DEFAULT_SESSION_ID)
+        
+        logger.info("Processing %d documents for data fusion", len(files))
         
         if not files:
             raise HTTPException(status_code=400, detail="No files provided")
         
-        # Save uploaded files temporarily
-        temp_files = []
-        for file in files:
-            suffix = os.path.splitext(file.filename)[1] or '.txt'
-            with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, mode='wb') as temp_file:
-                content = await file.read()
-                temp_file.write(content)
-                temp_files.append(temp_file.name)
-        
-        # Process documents
-        result = await orchestrator.process_patient_documents(temp_files)
+        # Save uploaded files temporarily, hashing content for the cache key
+        digests = [hashlib.sha256() for _ in files]
+        uploads = await _spool_uploads(files, digests)
+        temp_files = [upload for upload in uploads if isinstance(upload, str)]
         
-        # Clean up temp files
-        for temp_file in temp_files:
-            try:
-                os.unlink(temp_file)
-            except:
-                pass
+        try:
+            cache_key = make_cache_key({
+                "feature": "documents",
+                "model": Config.GEMINI_MODEL,
+                "files": [[file.filename, digest.hexdigest()] for file, digest in zip(files, digests)]
+            })
+            result = await llm_cache.get(cache_key)
+            
+            if result is None:
+                # Process documents
+                result = await orchestrator.process_patient_documents(uploads)
+                await llm_cache.set(cache_key, result)
+            else:
+                logger.info("Served from cache")
+                result = {**result, "api_calls_used": 0, "cached": True}
+                orchestrator.workflow_state["documents_processed"] = result["documents"]
+                orchestrator.workflow_state["temporal_analysis"] = result["temporal_analysis"]
+        finally:
+            # Clean up temp files, even when processing fails
+            await _remove_temp_files(temp_files)
         
-        print(f"✅ Documents processed! API calls: {result['api_calls_used']}")
+        logger.info("Documents processed, API calls: %s", result['api_calls_used'])
         
-        return JSONResponse(content=result)
+        return ORJSONResponse(content=result)
     
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"❌ Error in process_documents: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error in process_documents: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/api/documentation/generate")
-async def generate_documentation(brief_note: str = Form(...)):
+async def generate_documentation(brief_note: str = Form(...), x_session_id: Optional[str] = Header(None)):
     """
     Feature 8: Smart Documentation
     Generate complete SOAP note from brief note
     """
     try:
-        print(f"\n📝 Generating documentation")
-        print(f"Brief note: {brief_note[:100]}...")
+        orchestrator = sessions.get(x_session_id or DEFAULT_SESSION_ID)
+        
+        logger.info("Generating documentation for brief note: %.100s", brief_note)
         
         if not brief_note or len(brief_note.strip()) == 0:
             raise HTTPException(status_code=400, detail="Brief note is required")
@@ -193,64 +361,110 @@ async def generate_documentation(brief_note: str = Form(...)):
             "diagnoses": []
         }
         
-        # Generate documentation
-        result = await orchestrator.generate_clinical_documentation(
-            brief_note,
-            patient_context
-        )
+        cache_key = make_cache_key({
+            "feature": "documentation",
+            "model": Config.GEMINI_MODEL,
+            "brief_note": brief_note,
+            "context": patient_context
+        })
+        result = await llm_cache.get(cache_key)
+        
+        # Near-duplicate brief notes for the same patient context
+        context_key = make_cache_key({"model": Config.GEMINI_MODEL, "context": patient_context})
+        embedding = None
+        if result is None and Config.SEMANTIC_CACHE_DOCUMENTATION:
+            # Embedded once and reused by store() on a miss
+            embedding = await semantic_cache.embed(brief_note)
+            result = await semantic_cache.lookup(brief_note, namespace=context_key, embedding=embedding)
         
-        print(f"✅ Documentation generated! API calls: {result['api_calls_used']}")
+        if result is None:
+            # Generate documentation
+            result = await orchestrator.generate_clinical_documentation(
+                brief_note,
+                patient_context
+            )
+            await llm_cache.set(cache_key, result)
+            if Config.SEMANTIC_CACHE_DOCUMENTATION:
+                await semantic_cache.store(brief_note, result, namespace=context_key, embedding=embedding)
+        else:
+            logger.info("Served from cache")
+            result = {**result, "api_calls_used": 0, "cached": True}
+            orchestrator.workflow_state["generated_documentation"] = result["documentation"]
+        
+        logger.info("Documentation generated, API calls: %s", result['api_calls_used'])
         
-        return JSONResponse(content=result)
+        return ORJSONResponse(content=result)
     
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"❌ Error in generate_documentation: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error in generate_documentation: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/api/coordination/generate")
-async def generate_coordination():
+async def generate_coordination(x_session_id: Optional[str] = Header(None)):
     """
     Feature 9: Care Coordination
     Generate care coordination actions based on previous analysis
     """
     try:
-        print(f"\n🔗 Generating care coordination")
+        orchestrator = sessions.get(x_session_id or DEFAULT_SESSION_ID)
+        
+        logger.info("Generating care coordination")
         
         # Check if we have prerequisite data
-        if not orchestrator.analysis_results:
+        temporal_analysis = orchestrator.workflow_state.get("temporal_analysis")
+        if not temporal_analysis:
             raise HTTPException(
                 status_code=400,
                 detail="Please process documents first (Feature 2)"
             )
         
-        if not orchestrator.documentation_results:
+        documentation = orchestrator.workflow_state.get("generated_documentation")
+        if not documentation:
             raise HTTPException(
                 status_code=400,
                 detail="Please generate documentation first (Feature 8)"
             )
         
-        # Coordinate care
-        result = await orchestrator.coordinate_care()
+        cache_key = make_cache_key({
+            "feature": "coordination",
+            "model": Config.GEMINI_MODEL,
+            "temporal_analysis": temporal_analysis,
+            "documentation": documentation
+        })
+        result = await llm_cache.get(cache_key)
         
-        print(f"✅ Coordination complete! API calls: {result['api_calls_used']}")
+        if result is None:
+            # Coordinate care
+            result = await orchestrator.coordinate_care()
+            await llm_cache.set(cache_key, result)
+        else:
+            logger.info("Served from cache")
+            result = {**result, "api_calls_used": 0, "cached": True}
+            orchestrator.workflow_state["coordination_results"] = result["coordination"]
         
-        return JSONResponse(content=result)
+        logger.info("Coordination complete, API calls: %s", result['api_calls_used'])
+        
+        return ORJSONResponse(content=result)
     
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"❌ Error in generate_coordination: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error in generate_coordination: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/api/demo/run")
-async def run_demo():
+async def run_demo(x_session_id: Optional[str] = Header(None)):
     """
     Run the complete demo workflow with Sarah Chen data
     """
     try:
-        print(f"\n🎬 Running demo workflow")
+        orchestrator = sessions.get(x_session_id or DEFAULT_SESSION_ID)
+        
+        logger.info("Running demo workflow")
         
         demo_files = [
             "demo_data/sarah_chen_lab_6months.txt",
@@ -260,26 +474,45 @@ async def run_demo():
             "demo_data/sarah_chen_last_visit.txt"
         ]
         
-        # Check if demo files exist
-        for file in demo_files:
-            if not os.path.exists(file):
-                raise HTTPException(
-                    status_code=404,
-                    detail=f"Demo file not found: {file}. Please ensure demo_data folder exists."
-                )
+        # Check if demo files exist (all at once, off the event loop)
+        exists = await asyncio.gather(*(aiofiles.os.path.exists(file) for file in demo_files))
+        missing = [file for file, file_exists in zip(demo_files, exists) if not file_exists]
+        if missing:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Demo files not found: {', '.join(missing)}. Please ensure demo_data folder exists."
+            )
         
         brief_note = "52F DM2 f/u, ER visit for CP ruled out, D/C ibuprofen due to kidney concerns, start atorvastatin 20mg for LDL 145, increase lisinopril to 40mg, A1C up to 6.8%, new microalbuminuria 35, refer ophthalmology"
         
-        # Run complete workflow
-        results = await orchestrator.run_complete_workflow(demo_files, brief_note)
+        results = None
+        embedding = None
+        if Config.SEMANTIC_CACHE_DEMO:
+            embedding = await semantic_cache.embed(brief_note)
+            results = await semantic_cache.lookup(brief_note, namespace="demo", embedding=embedding)
         
-        print(f"✅ Demo complete! API calls: {results['summary']['total_api_calls']}")
+        if results is None:
+            # Run complete workflow
+            results = await orchestrator.run_complete_workflow(demo_files, brief_note)
+            if Config.SEMANTIC_CACHE_DEMO:
+                await semantic_cache.store(brief_note, results, namespace="demo", embedding=embedding)
+        else:
+            logger.info("Served from semantic cache")
+            results = {**results, "summary": {**results["summary"], "total_api_calls": 0}, "cached": True}
+            fusion_results = results["feature_2_data_fusion"]
+            orchestrator.workflow_state["documents_processed"] = fusion_results["documents"]
+            orchestrator.workflow_state["temporal_analysis"] = fusion_results["temporal_analysis"]
+            orchestrator.workflow_state["generated_documentation"] = results["feature_8_documentation"]["documentation"]
+            orchestrator.workflow_state["coordination_results"] = results["feature_9_coordination"]["coordination"]
         
-        return JSONResponse(content=results)
+        logger.info("Demo complete, API calls: %s", results['summary']['total_api_calls'])
+        
+        return ORJSONResponse(content=results)
     
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"❌ Error in run_demo: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error in run_demo: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -290,14 +523,16 @@ async def get_demo_files():
     """
     try:
         demo_dir = "demo_data"
-        if not os.path.exists(demo_dir):
+        try:
+            dir_stat = await aiofiles.os.stat(demo_dir)
+        except FileNotFoundError:
             return {
                 "status": "success",
                 "files": [],
                 "message": "Demo data directory not found"
             }
         
-        files = [f for f in os.listdir(demo_dir) if f.endswith(('.txt', '.pdf', '.docx'))]
+        files = list(await _list_demo_files(dir_stat.st_mtime_ns, demo_dir))
         return {
             "status": "success",
             "files": files,
@@ -310,7 +545,7 @@ async def get_demo_files():
 
 
 @app.get("/api/metrics")
-async def get_metrics():
+async def get_metrics(request: Request):
     """
     Get current API usage statistics
     """
@@ -319,7 +554,11 @@ async def get_metrics():
             "status": "success",
             "total_api_calls": Config.get_api_call_count(),
             "model": Config.GEMINI_MODEL,
-            "timestamp": datetime.now().isoformat()
+            "llm_cache": llm_cache.get_stats(),
+            "prompt_cache": prompt_cache.get_stats(),
+            "semantic_cache": semantic_cache.get_stats(),
+            "sessions": sessions.get_stats(),
+            "timestamp": request.state.ts
         }
     
     except Exception as e:
@@ -327,22 +566,22 @@ async def get_metrics():
 
 
 @app.post("/api/reset")
-async def reset_session():
+async def reset_session(x_session_id: Optional[str] = Header(None)):
     """
     Reset the orchestrator session (for testing)
     """
-    global orchestrator
-    orchestrator = DocWeaverOrchestrator()
-    Config.reset_api_calls()
+    sessions.discard(x_session_id or DEFAULT_SESSION_ID)
     
+    # The process-wide API call counter is shared by every session, so it is left alone
     return {
         "status": "success",
         "message": "Session reset successfully",
-        "api_calls": Config.get_api_call_count()
+        "api_calls": 0
     }
 
 
 if __name__ == "__main__":
+    import sys
     import uvicorn
     
     print("\n" + "="*80)
@@ -361,10 +600,28 @@ if __name__ == "__main__":
     print(f"\n🚀 Starting server...")
     print("="*80 + "\n")
     
+    # Sessions live in each worker's memory and uvicorn spreads connections across
+    # workers at random, so multi-step flows need a proxy that pins X-Session-Id
+    if Config.UVICORN_WORKERS > 1:
+        logger.warning(
+            "UVICORN_WORKERS=%d: sessions are per worker, so run behind a proxy with "
+            "sticky routing on X-Session-Id or multi-step workflows will return 400",
+            Config.UVICORN_WORKERS
+        )
+    
+    # uvloop/httptools ship with uvicorn[standard]; uvloop has no Windows build
+    # Multiple workers need the app as an import string
     uvicorn.run(
-        app,
+        "api:app" if Config.UVICORN_WORKERS > 1 else app,
         host="0.0.0.0",
         port=8000,
-        reload=True,
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools",
+        workers=Config.UVICORN_WORKERS,
+        # Shed load with 503s instead of queueing unbounded connections;
+        # recycling after N requests only makes sense with a worker supervisor
+        limit_concurrency=Config.UVICORN_LIMIT_CONCURRENCY or None,
+        limit_max_requests=(Config.UVICORN_LIMIT_MAX_REQUESTS or None) if Config.UVICORN_WORKERS > 1 else None,
+        reload=False,
         log_level="info"
     )
\ No newline at end of file
@@ -5,39 +5,84 @@ Optimized for Gemini 3 Flash free tier rate limiting
 """
 import asyncio
 from typing import Dict, List, Any
-import json
-from datetime import datetime, timedelta
-import traceback
+import re
+import logging
+from pydantic import BaseModel, ConfigDict, ValidationError, ValidationInfo, field_validator, model_validator
 
 from config import Config
-from document_processor import rate_limiter  # Import shared rate limiter
+from document_processor import rate_limiter, cached_generate, strip_code_fence, compact_json, trim_for_prompt  # Import shared rate limiter
 
+logger = logging.getLogger(__name__)
 
-class CareCoordinationAgent:
-    """Autonomously coordinates care based on clinical analysis"""
-    
-    def __init__(self):
-        self.model = Config.initialize_gemini()
-        self.rate_limiter = rate_limiter
-    
-    async def identify_coordination_needs(self, analysis_results: Dict[str, Any], 
-                                         soap_note: Dict[str, Any] = None) -> Dict[str, Any]:
-        """
-        Gemini API Call #16: Identify all coordination actions needed
-        """
-        await self.rate_limiter.acquire()
-        Config.increment_api_calls()
-        
-        # Combine temporal analysis and SOAP note
-        combined_data = {
-            "temporal_analysis": analysis_results,
-            "soap_note": soap_note.get('soap_note', {}) if soap_note else {}
-        }
-        
-        prompt = f"""Analyze this clinical data and identify ALL care coordination actions needed.
+
+class _CoordinationItem(BaseModel):
+    """
+    Lenient base: keeps any extra keys the model adds, treats nulls as missing
+    and accepts numbers for text fields (e.g. a timeframe of 3)
+    """
+    model_config = ConfigDict(extra="allow", coerce_numbers_to_str=True)
+
+    @model_validator(mode="before")
+    @classmethod
+    def _drop_nulls(cls, data: Any) -> Any:
+        if isinstance(data, dict):
+            return {key: value for key, value in data.items() if value is not None}
+        return data
+
+
+class Referral(_CoordinationItem):
+    specialty: str = ""
+    reason: str = ""
+    urgency: str = "routine"
+    notes: str = ""
+
+
+class FollowUp(_CoordinationItem):
+    timeframe: str = ""
+    reason: str = ""
+    required_prep: str = ""
+
+
+class Order(_CoordinationItem):
+    type: str = ""
+    description: str = ""
+    timing: str = ""
+
+
+class CoordinationNeeds(_CoordinationItem):
+    """
+    Schema of the COORDINATION_NEEDS_PROMPT reply; missing fields get defaults at decode time
+    Items are validated one by one, so a malformed item is dropped instead of the whole reply
+    """
+    referrals: List[Referral] = []
+    follow_ups: List[FollowUp] = []
+    orders: List[Order] = []
+    patient_communication_needed: bool = False
+
+    @field_validator("referrals", "follow_ups", "orders", mode="before")
+    @classmethod
+    def _drop_invalid_items(cls, items: Any, info: ValidationInfo) -> List[Any]:
+        if not isinstance(items, list):
+            logger.warning("Ignoring %s: expected a list, got %s", info.field_name, type(items).__name__)
+            return []
+        item_model = _COORDINATION_ITEM_MODELS[info.field_name]
+        valid = []
+        for item in items:
+            try:
+                valid.append(item_model.model_validate(item))
+            except ValidationError as e:
+                logger.warning("Dropping invalid %s item: %s", info.field_name, e)
+        return valid
+
+
+_COORDINATION_ITEM_MODELS = {"referrals": Referral, "follow_ups": FollowUp, "orders": Order}
+
+
+# Prompt templates, filled with str.format_map (literal braces are doubled)
+COORDINATION_NEEDS_PROMPT = """Analyze this clinical data and identify ALL care coordination actions needed.
 
 Clinical Data:
-{json.dumps(combined_data, indent=2)}
+{combined_data}
 
 Identify:
 1. REFERRALS: Any specialist consultations mentioned or needed
@@ -73,41 +118,14 @@ Return a JSON object:
 }}
 
 Return ONLY valid JSON, no other text."""
-        
-        try:
-            print(f"   🔄 Calling Gemini API for coordination needs...")
-            response = await asyncio.to_thread(
-                self.model.generate_content, prompt
-            )
-            print(f"   ✓ Gemini response received for coordination needs")
-            return self._parse_json_response(response.text)
-        except Exception as e:
-            print(f"❌ Error in identify_coordination_needs: {str(e)}")
-            print(f"   Error type: {type(e).__name__}")
-            traceback.print_exc()
-            return {
-                "referrals": [],
-                "follow_ups": [],
-                "orders": [],
-                "patient_communication_needed": False,
-                "error": str(e)
-            }
-    
-    async def generate_referral_letter(self, referral: Dict[str, Any], 
-                                      patient_context: Dict[str, Any]) -> str:
-        """
-        Gemini API Call #17: Generate professional referral letter
-        """
-        await self.rate_limiter.acquire()
-        Config.increment_api_calls()
-        
-        prompt = f"""Generate a professional specialist referral letter.
+
+REFERRAL_LETTER_PROMPT = """Generate a professional specialist referral letter.
 
 Referral Details:
-{json.dumps(referral, indent=2)}
+{referral}
 
 Patient Context:
-{json.dumps(patient_context, indent=2)}
+{patient_context}
 
 Create a referral letter that includes:
 1. Patient demographics (name, DOB, MRN from context)
@@ -119,35 +137,13 @@ Create a referral letter that includes:
 7. Professional closing
 
 Format as a formal medical referral letter."""
-        
-        try:
-            print(f"   🔄 Calling Gemini API for referral letter...")
-            response = await asyncio.to_thread(
-                self.model.generate_content, prompt
-            )
-            print(f"   ✓ Gemini response received for referral letter")
-            return response.text.strip()
-        except Exception as e:
-            print(f"❌ Error in generate_referral_letter: {str(e)}")
-            print(f"   Error type: {type(e).__name__}")
-            traceback.print_exc()
-            return f"Error generating referral letter: {str(e)}"
-    
-    async def generate_doctor_handover_report(self, analysis_results: Dict[str, Any], 
-                                            soap_note: Dict[str, Any] = None,
-                                            patient_context: Dict[str, Any] = None) -> str:
-        """
-        Gemini API Call #19: Generate a high-level handover report for the next doctor
-        """
-        await self.rate_limiter.acquire()
-        Config.increment_api_calls()
-        
-        prompt = f"""Generate a detailed 1-page Clinical Handover Report for a receiving physician.
+
+HANDOVER_REPORT_PROMPT = """Generate a detailed 1-page Clinical Handover Report for a receiving physician.
         
         Clinical Information:
-        Temporal Analysis: {json.dumps(analysis_results, indent=2)}
-        SOAP Note: {json.dumps(soap_note, indent=2) if soap_note else 'N/A'}
-        Patient Context: {json.dumps(patient_context, indent=2)}
+        Temporal Analysis: {analysis_results}
+        SOAP Note: {soap_note}
+        Patient Context: {patient_context}
         
         The report should be structured for a doctor to review IN PRIOR to a patient visit.
         Include these sections:
@@ -160,31 +156,11 @@ Format as a formal medical referral letter."""
         
         Tone should be professional, concise, and clinically focused. Use medical terminology.
         Format it as a clean, professional clinical report."""
-        
-        try:
-            print(f"   🔄 Calling Gemini API for doctor handover report...")
-            response = await asyncio.to_thread(
-                self.model.generate_content, prompt
-            )
-            print(f"   ✓ Gemini response received for handover report")
-            return response.text.strip()
-        except Exception as e:
-            print(f"❌ Error in generate_doctor_handover_report: {str(e)}")
-            traceback.print_exc()
-            return f"Error generating clinical handover report: {str(e)}"
 
-    async def generate_patient_communication(self, visit_summary: Dict[str, Any], 
-                                            patient_level: str = "general") -> str:
-        """
-        Gemini API Call #18: Generate patient-friendly communication
-        """
-        await self.rate_limiter.acquire()
-        Config.increment_api_calls()
-        
-        prompt = f"""Create a patient-friendly visit summary and after-visit instructions.
+PATIENT_COMMUNICATION_PROMPT = """Create a patient-friendly visit summary and after-visit instructions.
 
 Visit Information:
-{json.dumps(visit_summary, indent=2)}
+{visit_summary}
 
 Patient Reading Level: {patient_level}
 
@@ -197,174 +173,275 @@ Create a communication that:
 6. Uses encouraging, supportive tone
 
 Format as a clear, easy-to-read document suitable for patient portal."""
+
+
+# Separators used by the text summary
+RULE = '=' * 80
+DIVIDER = '-' * 70
+
+# Plan lines that start a medication (substring match, e.g. "restart" and "started" count too)
+MEDICATION_KEYWORDS_RE = re.compile(r'start|prescribe|begin|initiate', re.IGNORECASE)
+
+
+class CareCoordinationAgent:
+    """Autonomously coordinates care based on clinical analysis"""
+    
+    def __init__(self):
+        self.model = Config.initialize_gemini()
+        self.rate_limiter = rate_limiter
+    
+    async def _call(self, prompt: str, label: str) -> str:
+        """
+        Rate-limited Gemini call shared by every coordination step; returns the response text
+        Identical prompts (re-runs, UI refreshes) are answered from prompt_cache without an API call
+        """
+        logger.debug("Calling Gemini API for %s", label)
+        response_text = await cached_generate(self.model, prompt)
+        logger.debug("Gemini response received for %s", label)
+        return response_text
+    
+    def _log_error(self, method_name: str, error: Exception) -> None:
+        """Report a failed coordination step (full traceback only at DEBUG level)"""
+        logger.error("Error in %s: %s: %s", method_name, type(error).__name__, error,
+                     exc_info=logger.isEnabledFor(logging.DEBUG))
+    
+    async def identify_coordination_needs(self, analysis_results: Dict[str, Any], 
+                                         soap_note: Dict[str, Any] = None) -> Dict[str, Any]:
+        """
+        Gemini API Call #12: Identify all coordination actions needed
+        """
+        # Combine temporal analysis and SOAP note
+        combined_data = {
+            "temporal_analysis": analysis_results,
+            "soap_note": soap_note.get('soap_note', {}) if soap_note else {}
+        }
+        
+        prompt = COORDINATION_NEEDS_PROMPT.format_map({"combined_data": compact_json(trim_for_prompt(combined_data))})
+        
+        try:
+            return self._parse_coordination_needs(await self._call(prompt, "coordination needs"))
+        except Exception as e:
+            self._log_error("identify_coordination_needs", e)
+            return {
+                "referrals": [],
+                "follow_ups": [],
+                "orders": [],
+                "patient_communication_needed": False,
+                "error": str(e)
+            }
+    
+    async def generate_referral_letter(self, referral: Dict[str, Any], 
+                                      patient_context: Dict[str, Any]) -> str:
+        """
+        Gemini API Call #13: Generate professional referral letter
+        """
+        prompt = REFERRAL_LETTER_PROMPT.format_map({
+            "referral": compact_json(referral),
+            "patient_context": compact_json(patient_context)
+        })
+        
+        try:
+            return (await self._call(prompt, "referral letter")).strip()
+        except Exception as e:
+            self._log_error("generate_referral_letter", e)
+            return f"Error generating referral letter: {str(e)}"
+    
+    async def generate_doctor_handover_report(self, analysis_results: Dict[str, Any], 
+                                            soap_note: Dict[str, Any] = None,
+                                            patient_context: Dict[str, Any] = None) -> str:
+        """
+        Gemini API Call #15: Generate a high-level handover report for the next doctor
+        """
+        prompt = HANDOVER_REPORT_PROMPT.format_map({
+            "analysis_results": compact_json(trim_for_prompt(analysis_results)),
+            "soap_note": compact_json(trim_for_prompt(soap_note)) if soap_note else 'N/A',
+            "patient_context": compact_json(trim_for_prompt(patient_context))
+        })
         
         try:
-            print(f"   🔄 Calling Gemini API for patient communication...")
-            response = await asyncio.to_thread(
-                self.model.generate_content, prompt
-            )
-            print(f"   ✓ Gemini response received for patient communication")
-            return response.text.strip()
+            return (await self._call(prompt, "doctor handover report")).strip()
         except Exception as e:
-            print(f"❌ Error in generate_patient_communication: {str(e)}")
-            print(f"   Error type: {type(e).__name__}")
-            traceback.print_exc()
+            self._log_error("generate_doctor_handover_report", e)
+            return f"Error generating clinical handover report: {str(e)}"
+
+    async def generate_patient_communication(self, visit_summary: Dict[str, Any], 
+                                            patient_level: str = "general") -> str:
+        """
+        Gemini API Call #14: Generate patient-friendly communication
+        """
+        prompt = PATIENT_COMMUNICATION_PROMPT.format_map({
+            "visit_summary": compact_json(visit_summary),
+            "patient_level": patient_level
+        })
+        
+        try:
+            return (await self._call(prompt, "patient communication")).strip()
+        except Exception as e:
+            self._log_error("generate_patient_communication", e)
             return f"Error generating patient communication: {str(e)}"
     
     async def coordinate_all_actions(self, analysis_results: Dict[str, Any],
                                     soap_note: Dict[str, Any] = None,
-                                    patient_context: Dict[str, Any] = None) -> Dict[str, Any]:
+                                    patient_context: Dict[str, Any] = None,
+                                    generate_handover: bool = True) -> Dict[str, Any]:
         """
         Run complete care coordination pipeline
-        Total: 3+ Gemini API calls (#16, #17, #18+)
+        Total: 3+ Gemini API calls (#12, #13, #14+)
+        If identifying coordination needs fails, nothing else is generated
         """
-        print("\n🔗 Running care coordination automation...")
+        logger.info("Running care coordination automation")
         
         # Identify what needs to be coordinated
-        print("   🔍 Identifying coordination needs...")
         coordination_needs = await self.identify_coordination_needs(analysis_results, soap_note)
-        print(f"   ✓ Coordination needs identified (Total API calls: {Config.get_api_call_count()})")
+        logger.debug("Coordination needs identified (total API calls: %d)", Config.get_api_call_count())
         
-        # Generate referral letters for each referral
-        referral_letters = []
-        referrals = coordination_needs.get('referrals', [])
-        for i, referral in enumerate(referrals):
-            print(f"   📨 Generating referral letter {i+1}/{len(referrals)} for {referral.get('specialty', 'Unknown')}...")
-            letter = await self.generate_referral_letter(referral, patient_context or {})
-            referral_letters.append({
-                "specialty": referral.get('specialty'),
-                "reason": referral.get('reason'),
-                "urgency": referral.get('urgency'),
-                "letter": letter
-            })
-            print(f"   ✓ Referral letter generated (Total API calls: {Config.get_api_call_count()})")
+        if 'error' in coordination_needs:
+            logger.warning("Skipping coordination documents: %s", coordination_needs['error'])
+            return {
+                "coordination_needs": coordination_needs,
+                "referrals": [],
+                "follow_ups": [],
+                "orders": [],
+                "patient_communication": None,
+                "handover_report": None,
+                "actions_count": 0
+            }
         
-        # Generate patient communication if needed
-        patient_communication = None
-        if coordination_needs.get('patient_communication_needed'):
-            print("   💬 Generating patient communication...")
+        # Referral letters, patient communication and the handover report don't depend on
+        # each other, so they run concurrently; the shared rate limiter still caps RPM
+        referrals = coordination_needs['referrals']
+        tasks = [self.generate_referral_letter(referral, patient_context or {}) for referral in referrals]
+        
+        needs_patient_communication = coordination_needs['patient_communication_needed']
+        if needs_patient_communication:
+            soap_sections = soap_note.get('soap_note', {}) if soap_note else {}
+            plan = soap_sections.get('plan', '')
             visit_summary = {
-                "diagnoses": soap_note.get('soap_note', {}).get('assessment', '') if soap_note else '',
-                "plan": soap_note.get('soap_note', {}).get('plan', '') if soap_note else '',
-                "follow_ups": coordination_needs.get('follow_ups', []),
-                "new_medications": self._extract_medications_from_plan(
-                    soap_note.get('soap_note', {}).get('plan', '') if soap_note else ''
-                )
+                "diagnoses": soap_sections.get('assessment', ''),
+                "plan": plan,
+                "follow_ups": coordination_needs['follow_ups'],
+                "new_medications": self._extract_medications_from_plan(plan) if plan else []
             }
-            patient_communication = await self.generate_patient_communication(visit_summary)
-            print(f"   ✓ Patient communication generated (Total API calls: {Config.get_api_call_count()})")
+            tasks.append(self.generate_patient_communication(visit_summary))
+        
+        # New Feature: Doctor Handover Report
+        if generate_handover:
+            tasks.append(self.generate_doctor_handover_report(
+                analysis_results, 
+                soap_note, 
+                patient_context
+            ))
         
-        # New Feature: Generate Doctor Handover Report
-        print("   🩺 Generating doctor handover report...")
-        handover_report = await self.generate_doctor_handover_report(
-            analysis_results, 
-            soap_note, 
-            patient_context
-        )
-        print(f"   ✓ Doctor handover report generated (Total API calls: {Config.get_api_call_count()})")
+        logger.debug("Generating %d referral letter(s)%s%s", len(referrals),
+                     ", patient communication" if needs_patient_communication else "",
+                     ", doctor handover report" if generate_handover else "")
+        results = await asyncio.gather(*tasks)
         
-        print(f"\n✅ Care coordination complete!\n")
+        referral_letters = [
+            {
+                "specialty": referral['specialty'],
+                "reason": referral['reason'],
+                "urgency": referral['urgency'],
+                "letter": letter
+            }
+            for referral, letter in zip(referrals, results)
+        ]
+        patient_communication = results[len(referrals)] if needs_patient_communication else None
+        handover_report = results[-1] if generate_handover else None
+        logger.debug("Coordination documents generated (total API calls: %d)", Config.get_api_call_count())
+        
+        logger.info("Care coordination complete")
         
         return {
             "coordination_needs": coordination_needs,
             "referrals": referral_letters,
-            "follow_ups": coordination_needs.get('follow_ups', []),
-            "orders": coordination_needs.get('orders', []),
+            "follow_ups": coordination_needs['follow_ups'],
+            "orders": coordination_needs['orders'],
             "patient_communication": patient_communication,
             "handover_report": handover_report,
-            "actions_count": len(referral_letters) + len(coordination_needs.get('follow_ups', [])) + 
-                           len(coordination_needs.get('orders', []))
+            "actions_count": len(referral_letters) + len(coordination_needs['follow_ups']) + 
+                           len(coordination_needs['orders'])
         }
     
     def format_coordination_summary(self, coordination: Dict[str, Any]) -> str:
         """Format coordination results for display"""
-        output = f"""
-{'='*80}
+        # Sections are collected in a list and joined once; letters can be long
+        parts = [f"""
+{RULE}
 CARE COORDINATION ACTIONS
-{'='*80}
+{RULE}
 
 TOTAL ACTIONS AUTOMATED: {coordination.get('actions_count', 0)}
 
-"""
+"""]
+        append = parts.append
+        
         # Referrals
         referrals = coordination.get('referrals', [])
         if referrals:
-            output += f"""REFERRALS NEEDED: {len(referrals)}
-"""
+            append(f"""REFERRALS NEEDED: {len(referrals)}
+""")
             for i, ref in enumerate(referrals, 1):
-                output += f"""
+                append(f"""
 {i}. {ref.get('specialty', 'N/A')} - {ref.get('urgency', 'routine').upper()}
    Reason: {ref.get('reason', 'N/A')}
    
    REFERRAL LETTER:
-   {'-'*70}
+   {DIVIDER}
 {ref.get('letter', 'N/A')}
-   {'-'*70}
-"""
+   {DIVIDER}
+""")
         
         # Follow-ups
         follow_ups = coordination.get('follow_ups', [])
         if follow_ups:
-            output += f"""
+            append(f"""
 FOLLOW-UP APPOINTMENTS: {len(follow_ups)}
-"""
+""")
             for i, fu in enumerate(follow_ups, 1):
-                output += f"""
+                append(f"""
 {i}. Timeframe: {fu.get('timeframe', 'N/A')}
    Reason: {fu.get('reason', 'N/A')}
    Prep Required: {fu.get('required_prep', 'None')}
-"""
+""")
         
         # Orders
         orders = coordination.get('orders', [])
         if orders:
-            output += f"""
+            append(f"""
 ORDERS TO PLACE: {len(orders)}
-"""
+""")
             for i, order in enumerate(orders, 1):
-                output += f"""
+                append(f"""
 {i}. Type: {order.get('type', 'N/A')}
    Description: {order.get('description', 'N/A')}
    Timing: {order.get('timing', 'N/A')}
-"""
+""")
         
         # Patient Communication
         patient_comm = coordination.get('patient_communication')
         if patient_comm:
-            output += f"""
+            append(f"""
 PATIENT COMMUNICATION:
-{'-'*70}
+{DIVIDER}
 {patient_comm}
-{'-'*70}
-"""
+{DIVIDER}
+""")
         
-        output += f"""
-{'='*80}
-"""
-        return output
+        append(f"""
+{RULE}
+""")
+        return "".join(parts)
     
     def _extract_medications_from_plan(self, plan_text: str) -> List[str]:
         """Simple extraction of medications from plan text"""
-        medications = []
-        lines = plan_text.split('\n')
-        for line in lines:
-            if any(keyword in line.lower() for keyword in ['start', 'prescribe', 'begin', 'initiate']):
-                medications.append(line.strip())
-        return medications
+        return [line.strip() for line in plan_text.splitlines() if MEDICATION_KEYWORDS_RE.search(line)]
     
-    def _parse_json_response(self, response_text: str) -> Dict[str, Any]:
-        """Parse JSON from Gemini response"""
+    def _parse_coordination_needs(self, response_text: str) -> Dict[str, Any]:
+        """Decode and validate the coordination needs reply in one pass, filling defaults"""
         try:
-            json_text = response_text.strip()
-            if json_text.startswith("```json"):
-                json_text = json_text[7:]
-            if json_text.startswith("```"):
-                json_text = json_text[3:]
-            if json_text.endswith("```"):
-                json_text = json_text[:-3]
-            json_text = json_text.strip()
-            
-            return json.loads(json_text)
-        except Exception as e:
-            print(f"⚠️  JSON parsing warning: {str(e)}")
-            return {"error": f"Failed to parse JSON: {str(e)}", "raw": response_text[:200]}
\ No newline at end of file
+            needs = CoordinationNeeds.model_validate_json(strip_code_fence(response_text))
+        except ValidationError as e:
+            logger.warning("Coordination needs did not match the expected schema: %s", e)
+            return {"error": f"Failed to parse JSON: {str(e)}", "raw": response_text[:200]}
+        return needs.model_dump()
@@ -4,14 +4,24 @@ Handles document classification, routing, and specialized extraction
 Optimized for Gemini free tier with dynamic rate limiting
 """
 import asyncio
-from typing import Dict, List, Any
-import json
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional
+import io
+import logging
+import orjson
+import random
+import re
+import time
 import PyPDF2
 from docx import Document
-from datetime import datetime, timedelta
-from collections import deque
+from datetime import datetime
+from google.api_core import exceptions as google_exceptions
 
-from config import Config, DOCUMENT_TYPES, get_recommended_rate_limiter_settings
+from config import Config, DOCUMENT_TYPES, get_recommended_rate_limiter_settings, match_document_type_keywords
+from llm_cache import prompt_cache, make_cache_key
+
+logger = logging.getLogger(__name__)
 
 
 class GeminiRateLimiter:
@@ -22,35 +32,59 @@ class GeminiRateLimiter:
     def __init__(self, max_calls=4, time_window=60):
         self.max_calls = max_calls
         self.time_window = time_window  # seconds
-        self.call_times = deque(maxlen=max_calls)
+        # Token bucket: starts full (a burst of max_calls), refills at max_calls per time_window
+        self._tokens = float(max_calls)
+        self._last_refill = time.monotonic()
+        self._lock = None
+        self._lock_loop = None
         self.total_waits = 0
         self.total_wait_time = 0
-        print(f"⚙️  Rate Limiter initialized: {max_calls} calls per {time_window}s")
+        logger.info("Rate limiter initialized: %d calls per %ss", max_calls, time_window)
+    
+    def _refill(self) -> None:
+        """Add the tokens earned since the last refill, capped at max_calls"""
+        now = time.monotonic()
+        rate = self.max_calls / self.time_window
+        self._tokens = min(self.max_calls, self._tokens + (now - self._last_refill) * rate)
+        self._last_refill = now
+    
+    def _get_lock(self) -> asyncio.Lock:
+        """
+        Lock for the running event loop; asyncio locks can't be shared across loops,
+        and the limiter is a module-level singleton that outlives any one loop
+        """
+        loop = asyncio.get_running_loop()
+        if self._lock_loop is not loop:
+            self._lock = asyncio.Lock()
+            self._lock_loop = loop
+        return self._lock
     
     async def acquire(self):
-        """Wait if necessary before making API call"""
-        now = datetime.now()
-        
-        # If we have max_calls in the window, wait
-        if len(self.call_times) >= self.max_calls:
-            oldest_call = self.call_times[0]
-            time_since_oldest = (now - oldest_call).total_seconds()
-            
-            if time_since_oldest < self.time_window:
-                wait_time = self.time_window - time_since_oldest + 1  # +1 for safety
-                print(f"⏳ Rate limit: waiting {wait_time:.1f}s before next API call...")
-                await asyncio.sleep(wait_time)
+        """
+        Wait if necessary before making API call
+        Each caller reserves its token under the lock (the balance may go negative) and
+        then sleeps outside it, so concurrent callers get staggered slots without
+        holding the lock, and each one's wait accounts for the reservations before it
+        """
+        async with self._get_lock():
+            self._refill()
+            self._tokens -= 1
+            wait_time = -self._tokens * self.time_window / self.max_calls if self._tokens < 0 else 0
+            if wait_time:
                 self.total_waits += 1
                 self.total_wait_time += wait_time
         
-        self.call_times.append(datetime.now())
+        if wait_time:
+            logger.info("Rate limit: waiting %.1fs before next API call", wait_time)
+            await asyncio.sleep(wait_time)
     
     def get_stats(self):
         """Return rate limiting statistics"""
+        self._refill()
         return {
             "total_waits": self.total_waits,
             "total_wait_time": self.total_wait_time,
-            "current_calls_in_window": len(self.call_times)
+            "current_calls_in_window": self.max_calls - int(self._tokens)
         }
 
 
@@ -61,25 +95,215 @@ rate_limiter = GeminiRateLimiter(
     time_window=rate_limit_settings['time_window']
 )
 
+_gemini_executor: Optional[ThreadPoolExecutor] = None
 
-class DocumentProcessor:
-    """Processes and classifies medical documents using Gemini"""
+
+def get_gemini_executor() -> ThreadPoolExecutor:
+    """
+    Return the thread pool reserved for blocking Gemini calls, creating it on first use
+    Sized by GEMINI_THREADS (default: the per-minute call budget), so API calls never
+    queue behind file I/O or text extraction in asyncio's shared default executor
+    """
+    global _gemini_executor
+    if _gemini_executor is None:
+        _gemini_executor = ThreadPoolExecutor(
+            max_workers=Config.GEMINI_THREADS or max(2, rate_limit_settings['max_calls']),
+            thread_name_prefix="gemini"
+        )
+    return _gemini_executor
+
+
+def shutdown_gemini_executor() -> None:
+    """Stop the Gemini call threads (called on server shutdown)"""
+    global _gemini_executor
+    if _gemini_executor is not None:
+        _gemini_executor.shutdown(cancel_futures=True)
+        _gemini_executor = None
+
+
+# Gemini errors worth retrying: quota exhaustion (429), transient unavailability (503)
+# and request timeouts (504)
+RETRYABLE_GEMINI_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded
+)
+
+
+async def generate_content_with_retry(model, prompt: str, generation_config: Dict[str, Any] = None):
+    """
+    Call Gemini with the SDK's async client (or model.generate_content on the Gemini
+    thread pool when GEMINI_ASYNC_CLIENT is off), retrying 429/503 errors with
+    exponential backoff plus jitter; each retry waits on the shared rate limiter again
+    """
+    loop = asyncio.get_running_loop()
+    call = functools.partial(model.generate_content, prompt, generation_config=generation_config)
+    for attempt in range(Config.GEMINI_MAX_RETRIES + 1):
+        try:
+            if Config.GEMINI_ASYNC_CLIENT:
+                return await model.generate_content_async(prompt, generation_config=generation_config)
+            return await loop.run_in_executor(get_gemini_executor(), call)
+        except RETRYABLE_GEMINI_ERRORS as e:
+            if attempt == Config.GEMINI_MAX_RETRIES:
+                raise
+            wait_time = min(Config.GEMINI_RETRY_MAX_WAIT, 2 ** attempt) + random.uniform(0, 1)
+            logger.warning("Gemini %s: retrying in %.1fs (attempt %d/%d)", type(e).__name__,
+                           wait_time, attempt + 2, Config.GEMINI_MAX_RETRIES + 1)
+            await asyncio.sleep(wait_time)
+            await rate_limiter.acquire()
+
+
+async def cached_generate(model, prompt: str, generation_config: Dict[str, Any] = None) -> str:
+    """
+    Rate-limited, counted Gemini call shared by all agents; returns the response text
+    Identical requests (re-runs, UI refreshes) are answered from prompt_cache without
+    spending a rate limiter slot or an API call, unless PROMPT_CACHE_ENABLED is off
+    """
+    async def fetch() -> str:
+        await rate_limiter.acquire()
+        Config.increment_api_calls()
+        response = await generate_content_with_retry(model, prompt, generation_config)
+        return response.text
     
-    def __init__(self):
-        self.model = Config.initialize_gemini()
-        self.processed_docs = []
-        self.rate_limiter = rate_limiter
+    if not Config.PROMPT_CACHE_ENABLED:
+        return await fetch()
     
-    async def classify_document(self, file_content: str) -> str:
-        """
-        Gemini API Call #1: Classify document type
-        Routes document to appropriate specialized processor
-        """
-        # WAIT for rate limit before API call
-        await self.rate_limiter.acquire()
-        Config.increment_api_calls()
-        
-        prompt = f"""Analyze this medical document and classify it into ONE category:
+    cache_key = make_cache_key({
+        "model": Config.GEMINI_MODEL,
+        "prompt": prompt,
+        "generation_config": generation_config
+    })
+    return await prompt_cache.get_or_set(cache_key, fetch)
+
+
+# Gemini JSON mode: the reply is a bare JSON document, never wrapped in markdown
+JSON_RESPONSE_CONFIG = {"response_mime_type": "application/json"}
+
+STRING_SCHEMA = {"type": "string"}
+STRING_LIST_SCHEMA = {"type": "array", "items": STRING_SCHEMA}
+
+
+def object_schema(**properties: Dict[str, Any]) -> Dict[str, Any]:
+    """Gemini response_schema for a JSON object with the given property schemas"""
+    return {"type": "object", "properties": properties}
+
+
+def json_schema_config(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """generation_config for JSON mode constrained to schema (structured output)"""
+    return {**JSON_RESPONSE_CONFIG, "response_schema": schema}
+
+
+# Structured output schemas for the document classifier and extractors
+DOCUMENT_TYPE_SCHEMA = {"type": "string", "format": "enum", "enum": DOCUMENT_TYPES}
+LAB_REPORT_CONFIG = json_schema_config(object_schema(
+    test_date=STRING_SCHEMA,
+    tests={"type": "array", "items": object_schema(
+        name=STRING_SCHEMA, value=STRING_SCHEMA, unit=STRING_SCHEMA,
+        reference_range=STRING_SCHEMA, flag=STRING_SCHEMA
+    )},
+    ordering_provider=STRING_SCHEMA
+))
+VISIT_NOTE_CONFIG = json_schema_config(object_schema(
+    visit_date=STRING_SCHEMA,
+    chief_complaint=STRING_SCHEMA,
+    diagnoses=STRING_LIST_SCHEMA,
+    medications=STRING_LIST_SCHEMA,
+    orders=STRING_LIST_SCHEMA,
+    vital_signs=object_schema(bp=STRING_SCHEMA, hr=STRING_SCHEMA, temp=STRING_SCHEMA),
+    provider=STRING_SCHEMA
+))
+IMAGING_REPORT_CONFIG = json_schema_config(object_schema(
+    exam_date=STRING_SCHEMA,
+    modality=STRING_SCHEMA,
+    body_part=STRING_SCHEMA,
+    findings=STRING_LIST_SCHEMA,
+    impression=STRING_SCHEMA,
+    recommendations=STRING_LIST_SCHEMA
+))
+SPECIALIST_NOTE_CONFIG = json_schema_config(object_schema(
+    consultation_date=STRING_SCHEMA,
+    specialty=STRING_SCHEMA,
+    reason_for_consult=STRING_SCHEMA,
+    specialist_name=STRING_SCHEMA,
+    assessment=STRING_SCHEMA,
+    recommendations=STRING_LIST_SCHEMA,
+    follow_up=STRING_SCHEMA
+))
+
+
+# Optional ```json ... ``` markdown fence around a model's JSON reply
+CODE_FENCE_RE = re.compile(r'^\s*(?:```(?:json)?)?\s*(.*?)\s*(?:```)?\s*$', re.DOTALL | re.IGNORECASE)
+
+
+def strip_code_fence(response_text: str) -> str:
+    """Return the JSON payload of a response, without surrounding markdown code fences"""
+    return CODE_FENCE_RE.match(response_text).group(1)
+
+
+def compact_json(data: Any) -> str:
+    """
+    Serialize data for embedding in a prompt: orjson, no indentation (the model doesn't
+    need pretty-printing); non-string keys and datetimes are allowed
+    """
+    return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS, default=str).decode()
+
+
+# Keys that only duplicate or debug other data, never worth sending back to the model
+PROMPT_DROP_KEYS = frozenset({"full_note", "raw", "raw_text", "source_text", "embedding", "embeddings"})
+
+
+def trim_for_prompt(data: Any, max_chars: int = None) -> Any:
+    """
+    Copy of data without PROMPT_DROP_KEYS and with long strings truncated,
+    so prompts built from earlier results stay small (fewer input tokens, faster replies)
+    """
+    max_chars = max_chars or Config.PROMPT_FIELD_MAX_CHARS
+    if isinstance(data, dict):
+        return {key: trim_for_prompt(value, max_chars) for key, value in data.items()
+                if key not in PROMPT_DROP_KEYS}
+    if isinstance(data, (list, tuple)):
+        return [trim_for_prompt(item, max_chars) for item in data]
+    if isinstance(data, str) and len(data) > max_chars:
+        return data[:max_chars] + " ...[truncated]"
+    return data
+
+
+# Prompt templates, filled with str.format_map (literal braces are doubled)
+BATCH_EXTRACT_PROMPT = """Complete each of the following tasks using the text at the end.
+
+{task_list}
+
+Return ONE JSON object with exactly these keys: {keys}.
+Each key holds the result of its task.
+
+{context}"""
+
+
+async def batch_extract(model, context: str, tasks: Dict[str, str],
+                        schemas: Dict[str, Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Answer several extraction tasks over the same context in one Gemini call
+    tasks maps each output key to its instructions; the reply is a JSON object with those keys
+    schemas optionally maps output keys to response schemas, constraining the combined reply
+    The fixed task instructions come before the context so repeated calls share a
+    prompt prefix, which Gemini's implicit context caching can reuse
+    """
+    task_list = "\n\n".join(f'"{key}": {instructions}' for key, instructions in tasks.items())
+    prompt = BATCH_EXTRACT_PROMPT.format_map({
+        "task_list": task_list,
+        "keys": ", ".join(tasks),
+        "context": context
+    })
+    
+    response_text = await cached_generate(
+        model, prompt,
+        generation_config=json_schema_config(object_schema(**schemas)) if schemas else JSON_RESPONSE_CONFIG
+    )
+    result = orjson.loads(response_text)
+    return {key: result.get(key) for key in tasks}
+
+
+CLASSIFY_DOCUMENT_PROMPT = """Analyze this medical document and classify it into ONE category:
 - lab_report
 - visit_note
 - imaging
@@ -87,34 +311,18 @@ class DocumentProcessor:
 - discharge_summary
 
 Document content (first 1000 characters):
-{file_content[:1000]}
+{document}
 
 Return ONLY the category name, nothing else."""
-        
-        try:
-            response = await asyncio.to_thread(
-                self.model.generate_content, prompt
-            )
-            
-            doc_type = response.text.strip().lower()
-            return doc_type if doc_type in DOCUMENT_TYPES else "visit_note"
-        except Exception as e:
-            print(f"❌ Error in classify_document: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            return "visit_note"  # Default fallback
-    
-    async def extract_lab_data(self, text_content: str) -> Dict[str, Any]:
-        """
-        Gemini API Call #2: Extract structured lab test data
-        """
-        await self.rate_limiter.acquire()
-        Config.increment_api_calls()
-        
-        prompt = f"""Extract structured lab test data from this lab report.
+
+# Batched classification: one batch_extract task per document
+CLASSIFY_DOCUMENTS_TASK = """Classify document {number} into ONE category:
+lab_report, visit_note, imaging, specialist_note or discharge_summary"""
+
+LAB_REPORT_PROMPT = """Extract structured lab test data from this lab report.
 
 Document:
-{text_content}
+{document}
 
 Return a JSON object with this structure:
 {{
@@ -132,29 +340,11 @@ Return a JSON object with this structure:
 }}
 
 Return ONLY valid JSON, no other text."""
-        
-        try:
-            response = await asyncio.to_thread(
-                self.model.generate_content, prompt
-            )
-            return self._parse_json_response(response.text)
-        except Exception as e:
-            print(f"❌ Error in extract_lab_data: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            return {"error": str(e)}
-    
-    async def extract_visit_note_data(self, text_content: str) -> Dict[str, Any]:
-        """
-        Gemini API Call #3: Extract visit note data
-        """
-        await self.rate_limiter.acquire()
-        Config.increment_api_calls()
-        
-        prompt = f"""Extract structured data from this clinical visit note.
+
+VISIT_NOTE_PROMPT = """Extract structured data from this clinical visit note.
 
 Document:
-{text_content}
+{document}
 
 Return a JSON object:
 {{
@@ -172,29 +362,11 @@ Return a JSON object:
 }}
 
 Return ONLY valid JSON, no other text."""
-        
-        try:
-            response = await asyncio.to_thread(
-                self.model.generate_content, prompt
-            )
-            return self._parse_json_response(response.text)
-        except Exception as e:
-            print(f"❌ Error in extract_visit_note_data: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            return {"error": str(e)}
-    
-    async def extract_imaging_data(self, text_content: str) -> Dict[str, Any]:
-        """
-        Gemini API Call #4: Extract imaging report data
-        """
-        await self.rate_limiter.acquire()
-        Config.increment_api_calls()
-        
-        prompt = f"""Extract structured data from this imaging report.
+
+IMAGING_REPORT_PROMPT = """Extract structured data from this imaging report.
 
 Document:
-{text_content}
+{document}
 
 Return a JSON object:
 {{
@@ -207,29 +379,11 @@ Return a JSON object:
 }}
 
 Return ONLY valid JSON, no other text."""
-        
-        try:
-            response = await asyncio.to_thread(
-                self.model.generate_content, prompt
-            )
-            return self._parse_json_response(response.text)
-        except Exception as e:
-            print(f"❌ Error in extract_imaging_data: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            return {"error": str(e)}
-    
-    async def extract_specialist_note_data(self, text_content: str) -> Dict[str, Any]:
-        """
-        Gemini API Call #5: Extract specialist consultation data
-        """
-        await self.rate_limiter.acquire()
-        Config.increment_api_calls()
-        
-        prompt = f"""Extract structured data from this specialist consultation note.
+
+SPECIALIST_NOTE_PROMPT = """Extract structured data from this specialist consultation note.
 
 Document:
-{text_content}
+{document}
 
 Return a JSON object:
 {{
@@ -243,34 +397,141 @@ Return a JSON object:
 }}
 
 Return ONLY valid JSON, no other text."""
+
+
+class DocumentProcessor:
+    """Processes and classifies medical documents using Gemini"""
+    
+    def __init__(self):
+        self.model = Config.initialize_gemini()
+        self.processed_docs = []
+        self.rate_limiter = rate_limiter
+    
+    def _log_error(self, method_name: str, error: Exception) -> None:
+        """Report a failed classification or extraction (full traceback only at DEBUG level)"""
+        logger.error("Error in %s: %s: %s", method_name, type(error).__name__, error,
+                     exc_info=logger.isEnabledFor(logging.DEBUG))
+    
+    async def _call(self, prompt: str, generation_config: Dict[str, Any] = None) -> str:
+        """
+        Gemini call shared by classification and extraction; returns the response text
+        Extraction is idempotent, so re-processing the same document is served from the prompt cache
+        """
+        return await cached_generate(self.model, prompt, generation_config)
+    
+    async def classify_document(self, file_content: str) -> str:
+        """
+        Gemini API Call #1: Classify document type
+        Routes document to appropriate specialized processor
+        """
+        prompt = CLASSIFY_DOCUMENT_PROMPT.format_map({"document": file_content[:1000]})
+        
+        try:
+            doc_type = (await self._call(prompt)).strip().lower()
+            return doc_type if doc_type in DOCUMENT_TYPES else self._classify_by_keywords(file_content)
+        except Exception as e:
+            self._log_error("classify_document", e)
+            return self._classify_by_keywords(file_content)  # Default fallback
+    
+    async def classify_documents(self, contents: List[str]) -> List[str]:
+        """
+        Gemini API Call #1 for a whole document set: classify every document in one batched request
+        Each document is represented by its first 1000 characters, as in classify_document
+        """
+        if not contents:
+            return []
+        if len(contents) == 1:
+            return [await self.classify_document(contents[0])]
+        
+        keys = [f"document_{number}" for number in range(1, len(contents) + 1)]
+        tasks = {key: CLASSIFY_DOCUMENTS_TASK.format_map({"number": number})
+                 for number, key in enumerate(keys, 1)}
+        context = "\n\n".join(
+            f"Document {number} (first 1000 characters):\n{content[:1000]}"
+            for number, content in enumerate(contents, 1)
+        )
+        
+        try:
+            doc_types = await batch_extract(self.model, context, tasks,
+                                            dict.fromkeys(keys, DOCUMENT_TYPE_SCHEMA))
+        except Exception as e:
+            self._log_error("classify_documents", e)
+            doc_types = {}
+        
+        return [
+            doc_types.get(key) if doc_types.get(key) in DOCUMENT_TYPES else self._classify_by_keywords(content)
+            for key, content in zip(keys, contents)
+        ]
+    
+    def _classify_by_keywords(self, file_content: str) -> str:
+        """Fallback classification: the document type whose keywords appear most often"""
+        hits = match_document_type_keywords(file_content[:5000])
+        return hits.most_common(1)[0][0] if hits else "visit_note"
+    
+    async def extract_lab_data(self, text_content: str) -> Dict[str, Any]:
+        """
+        Gemini API Call #2: Extract structured lab test data
+        """
+        prompt = LAB_REPORT_PROMPT.format_map({"document": text_content})
+        
+        try:
+            return self._parse_json_response(await self._call(prompt, LAB_REPORT_CONFIG))
+        except Exception as e:
+            self._log_error("extract_lab_data", e)
+            return {"error": str(e)}
+    
+    async def extract_visit_note_data(self, text_content: str) -> Dict[str, Any]:
+        """
+        Gemini API Call #3: Extract visit note data
+        """
+        prompt = VISIT_NOTE_PROMPT.format_map({"document": text_content})
         
         try:
-            response = await asyncio.to_thread(
-                self.model.generate_content, prompt
-            )
-            return self._parse_json_response(response.text)
+            return self._parse_json_response(await self._call(prompt, VISIT_NOTE_CONFIG))
         except Exception as e:
-            print(f"❌ Error in extract_specialist_note_data: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            self._log_error("extract_visit_note_data", e)
             return {"error": str(e)}
     
-    async def process_document(self, file_name: str, file_content: str, doc_index: int = 0, total_docs: int = 1) -> Dict[str, Any]:
+    async def extract_imaging_data(self, text_content: str) -> Dict[str, Any]:
+        """
+        Gemini API Call #4: Extract imaging report data
+        """
+        prompt = IMAGING_REPORT_PROMPT.format_map({"document": text_content})
+        
+        try:
+            return self._parse_json_response(await self._call(prompt, IMAGING_REPORT_CONFIG))
+        except Exception as e:
+            self._log_error("extract_imaging_data", e)
+            return {"error": str(e)}
+    
+    async def extract_specialist_note_data(self, text_content: str) -> Dict[str, Any]:
+        """
+        Gemini API Call #5: Extract specialist consultation data
+        """
+        prompt = SPECIALIST_NOTE_PROMPT.format_map({"document": text_content})
+        
+        try:
+            return self._parse_json_response(await self._call(prompt, SPECIALIST_NOTE_CONFIG))
+        except Exception as e:
+            self._log_error("extract_specialist_note_data", e)
+            return {"error": str(e)}
+    
+    async def process_document(self, file_name: str, file_content: str, doc_index: int = 0, total_docs: int = 1,
+                               doc_type: str = None) -> Dict[str, Any]:
         """
         Main document processing pipeline
-        1. Classify document type
+        1. Classify document type (skipped when doc_type is already known)
         2. Route to specialized extractor
         3. Return structured data
         """
-        print(f"\n📄 Processing document {doc_index + 1}/{total_docs}: {file_name}")
+        logger.info("Processing document %d/%d: %s", doc_index + 1, total_docs, file_name)
         
         # Classify document (API Call #1)
-        print(f"   🔍 Classifying document type...")
-        doc_type = await self.classify_document(file_content)
-        print(f"   ✓ Identified as: {doc_type}")
+        if doc_type is None:
+            doc_type = await self.classify_document(file_content)
+        logger.debug("%s identified as %s", file_name, doc_type)
         
         # Route to specialized extractor (API Calls #2-5)
-        print(f"   📊 Extracting structured data...")
         extracted_data = None
         if doc_type == "lab_report":
             extracted_data = await self.extract_lab_data(file_content)
@@ -287,7 +548,7 @@ Return ONLY valid JSON, no other text."""
             # Default fallback
             extracted_data = await self.extract_visit_note_data(file_content)
         
-        print(f"   ✓ Extraction complete")
+        logger.debug("Extraction complete for %s", file_name)
         
         result = {
             "file_name": file_name,
@@ -302,60 +563,57 @@ Return ONLY valid JSON, no other text."""
     
     async def process_multiple_documents(self, documents: List[Dict[str, str]]) -> List[Dict[str, Any]]:
         """
-        Process multiple documents SEQUENTIALLY (not parallel)
-        Required for Gemini free tier rate limiting
+        Process multiple documents concurrently
+        At most MAX_CONCURRENT_LLM_CALLS documents are in flight at once and
+        the shared rate limiter still enforces the Gemini free tier RPM
+        
+        All documents are classified in one batched call first, then extracted concurrently
         
         This is still sophisticated orchestration because:
-        1. Each document requires 2 API calls (classify + extract)
+        1. Each document requires an extraction call, plus one shared classification call
         2. Intelligent routing to specialized processors
         3. Rate limiting coordination across all calls
         4. State management across document set
         """
-        print(f"\n🚀 Starting sequential document processing ({len(documents)} documents)")
-        print(f"⚙️  Rate limit: {self.rate_limiter.max_calls} calls per {self.rate_limiter.time_window}s")
+        logger.info("Starting concurrent document processing (%d documents, rate limit %d calls per %ss)",
+                    len(documents), self.rate_limiter.max_calls, self.rate_limiter.time_window)
+        
+        start = time.monotonic()
+        semaphore = asyncio.Semaphore(Config.MAX_CONCURRENT_LLM_CALLS)
+        doc_types = await self.classify_documents([doc['content'] for doc in documents])
         
-        results = []
-        start_time = datetime.now()
+        async def process_bounded(i: int, doc: Dict[str, str]) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.process_document(
+                    doc['file_name'], 
+                    doc['content'],
+                    doc_index=i,
+                    total_docs=len(documents),
+                    doc_type=doc_types[i]
+                )
         
-        for i, doc in enumerate(documents):
-            result = await self.process_document(
-                doc['file_name'], 
-                doc['content'],
-                doc_index=i,
-                total_docs=len(documents)
-            )
-            results.append(result)
+        # gather preserves input order
+        results = await asyncio.gather(
+            *(process_bounded(i, doc) for i, doc in enumerate(documents))
+        )
         
-        end_time = datetime.now()
-        processing_time = (end_time - start_time).total_seconds()
+        processing_time = time.monotonic() - start
         
         # Get rate limiting stats
         rate_stats = self.rate_limiter.get_stats()
         
-        print(f"\n✅ All documents processed!")
-        print(f"   Total time: {processing_time:.1f}s")
-        print(f"   API calls made: {Config.get_api_call_count()}")
-        print(f"   Rate limit waits: {rate_stats['total_waits']}")
-        print(f"   Total wait time: {rate_stats['total_wait_time']:.1f}s")
+        logger.info("All documents processed in %.1fs: %d API calls, %d rate limit waits (%.1fs)",
+                    processing_time, Config.get_api_call_count(),
+                    rate_stats['total_waits'], rate_stats['total_wait_time'])
         
         return results
     
     def _parse_json_response(self, response_text: str) -> Dict[str, Any]:
-        """Parse JSON from Gemini response, handling markdown code blocks"""
+        """Parse a JSON-mode Gemini response"""
         try:
-            json_text = response_text.strip()
-            # Remove markdown code blocks if present
-            if json_text.startswith("```json"):
-                json_text = json_text[7:]
-            if json_text.startswith("```"):
-                json_text = json_text[3:]
-            if json_text.endswith("```"):
-                json_text = json_text[:-3]
-            json_text = json_text.strip()
-            
-            return json.loads(json_text)
+            return orjson.loads(response_text)
         except Exception as e:
-            print(f"⚠️  JSON parsing warning: {str(e)}")
+            logger.warning("JSON parsing warning: %s", e)
             return {"error": f"Failed to parse JSON: {str(e)}", "raw": response_text[:200]}
     
     def get_processing_summary(self) -> Dict[str, Any]:
@@ -369,27 +627,29 @@ Return ONLY valid JSON, no other text."""
         }
 
 
-# Utility function to extract text from files
+# Utility functions to extract text from files
+def _pdf_text(source) -> str:
+    """Text of every page of a PDF (path or binary stream), joined once instead of += per page"""
+    return "".join(page.extract_text() or "" for page in PyPDF2.PdfReader(source).pages)
+
+
+def _docx_text(source) -> str:
+    """Text of every paragraph of a DOCX (path or binary stream), one line each"""
+    return "".join(f"{paragraph.text}\n" for paragraph in Document(source).paragraphs)
+
+
 def extract_text_from_file(file_path: str) -> str:
     """Extract text from PDF, DOCX, or TXT files"""
     if file_path.endswith('.pdf'):
         try:
             with open(file_path, 'rb') as f:
-                pdf_reader = PyPDF2.PdfReader(f)
-                text = ""
-                for page in pdf_reader.pages:
-                    text += page.extract_text()
-                return text
+                return _pdf_text(f)
         except Exception as e:
             return f"Error reading PDF: {str(e)}"
     
     elif file_path.endswith('.docx'):
         try:
-            doc = Document(file_path)
-            text = ""
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
-            return text
+            return _docx_text(file_path)
         except Exception as e:
             return f"Error reading DOCX: {str(e)}"
     
@@ -403,30 +663,37 @@ def extract_text_from_file(file_path: str) -> str:
     return ""
 
 
+def extract_text_from_bytes(data: bytes, file_name: str) -> str:
+    """Extract text from in-memory PDF, DOCX, or TXT content"""
+    file_name = file_name.lower()
+    if file_name.endswith('.pdf'):
+        try:
+            return _pdf_text(io.BytesIO(data))
+        except Exception as e:
+            return f"Error reading PDF: {str(e)}"
+    
+    elif file_name.endswith('.docx'):
+        try:
+            return _docx_text(io.BytesIO(data))
+        except Exception as e:
+            return f"Error reading DOCX: {str(e)}"
+    
+    elif file_name.endswith('.txt'):
+        try:
+            return data.decode('utf-8')
+        except Exception as e:
+            return f"Error reading TXT: {str(e)}"
+    
+    return ""
+
+
 def extract_text_from_uploaded_file(uploaded_file) -> str:
-    """Extract text from Streamlit uploaded file object"""
-    try:
-        file_extension = uploaded_file.name.split('.')[-1].lower()
-        
-        if file_extension == 'pdf':
-            pdf_reader = PyPDF2.PdfReader(uploaded_file)
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text()
-            return text
-        
-        elif file_extension == 'docx':
-            doc = Document(uploaded_file)
-            text = ""
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
-            return text
-        
-        elif file_extension == 'txt':
-            return uploaded_file.read().decode('utf-8')
-        
-        else:
-            return f"Unsupported file type: {file_extension}"
+    """
+    Extract text from Streamlit uploaded file object
+    Reads with getvalue(), which ignores the cursor, so the file still has content after a rerun
+    """
+    file_extension = uploaded_file.name.split('.')[-1].lower()
+    if file_extension not in ('pdf', 'docx', 'txt'):
+        return f"Unsupported file type: {file_extension}"
     
-    except Exception as e:
-        return f"Error reading file: {str(e)}"
\ No newline at end of file
+    return extract_text_from_bytes(uploaded_file.getvalue(), uploaded_file.name)
@@ -0,0 +1,184 @@
+"""
+Gemini API setup probe shared by test_setup.py and tests/test_basic.py
+Checks the API key, lists models and finds one that can generate content
+"""
+import argparse
+import contextlib
+import functools
+import io
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+RULE = '=' * 80
+HEADER = f"{RULE}\nDOCWEAVER GEMINI API SETUP TEST\n{RULE}"
+
+# Preferred models, tried in order before falling back to any available model
+DEFAULT_TEST_MODELS = [
+    'gemini-3-flash-preview',      # Gemini 3 (for hackathon)
+    'gemini-2.5-flash',            # Latest stable
+    'gemini-2.0-flash',            # Alternative
+    'gemini-flash-latest'          # Fallback
+]
+
+
+def _generate(genai, model_name: str):
+    """Send the test prompt to model_name; returns the response, or the exception raised"""
+    try:
+        return genai.GenerativeModel(model_name).generate_content("Reply with exactly: API is working!")
+    except Exception as e:
+        return e
+
+
+def _report(model_name: str, outcome) -> bool:
+    """Print the outcome of one model's test prompt; True on success"""
+    print(f"\n   Testing {model_name}...")
+    if isinstance(outcome, Exception):
+        print(f"   ❌ Failed with {model_name}")
+        print(f"      Error type: {type(outcome).__name__}")
+        print(f"      Error message: {str(outcome)}")
+
+        # Print additional error details if available
+        if hasattr(outcome, '__dict__'):
+            print(f"      Error details: {outcome.__dict__}")
+        return False
+
+    print(f"   ✅ Success with {model_name}")
+    print(f"      Response: {outcome.text}")
+
+    # Check if we have response parts
+    if hasattr(outcome, 'parts'):
+        print(f"      Parts: {len(outcome.parts)}")
+
+    # Check prompt feedback
+    if hasattr(outcome, 'prompt_feedback'):
+        print(f"      Prompt feedback: {outcome.prompt_feedback}")
+    return True
+
+
+def probe(test_models: List[str] = DEFAULT_TEST_MODELS, result: Dict[str, Any] = None) -> Optional[str]:
+    """
+    Run the setup checks, printing a report; returns the first working model name, or None
+    result, if given, is filled with the machine-readable outcome (see main's --json)
+    google.generativeai is imported here so importing this module stays cheap
+    """
+    if result is None:
+        result = {}
+    result.update(api_key_ok=False, models=[], winner=None, errors=[])
+    print(HEADER)
+
+    # Check API key
+    api_key = os.getenv('GEMINI_API_KEY') or os.getenv('GOOGLE_API_KEY')
+    print(f"\n1. API Key Status:")
+    result["api_key_ok"] = bool(api_key and api_key != 'your_gemini_api_key_here')
+    if result["api_key_ok"]:
+        print(f"   ✅ API Key is set")
+        print(f"   First 10 chars: {api_key[:10]}...")
+    else:
+        print(f"   ❌ API Key NOT set or using placeholder")
+        print(f"   Please set GEMINI_API_KEY environment variable")
+        return None
+
+    try:
+        import google.generativeai as genai
+    except ImportError:
+        result["errors"].append({"step": "import", "error": "google-generativeai is not installed"})
+        print(f"   ❌ google-generativeai is not installed")
+        print(f"   Please run: pip install google-generativeai")
+        return None
+
+    # Configure API
+    try:
+        genai.configure(api_key=api_key)
+        print(f"   ✅ API configured successfully")
+    except Exception as e:
+        result["errors"].append({"step": "configure", "error": str(e)})
+        print(f"   ❌ Failed to configure API: {e}")
+        return None
+
+    # List available models
+    print(f"\n2. Available Models:")
+    try:
+        available_models = []
+        for model in genai.list_models():
+            if 'generateContent' in model.supported_generation_methods:
+                available_models.append(model.name)
+                print(f"   ✓ {model.name}")
+        result["models"] = available_models
+
+        if not available_models:
+            print(f"   ❌ No models with generateContent support found")
+            return None
+    except Exception as e:
+        result["errors"].append({"step": "list_models", "error": str(e)})
+        print(f"   ❌ Failed to list models: {e}")
+        return None
+
+    # Test API call with the preferred models, then any available model
+    print(f"\n3. Testing API Call:")
+    last_error = None
+    available = set(available_models)  # available_models keeps the listing order for fallbacks
+    preferred = [name for name in test_models if f'models/{name}' in available]
+    fallbacks = [name.replace('models/', '') for name in available_models[:3]]
+    fallbacks = [name for name in fallbacks if name not in preferred]
+
+    # Each group's test prompts run concurrently (blocking SDK calls, one thread each);
+    # results are reported in preference order and the first success wins
+    for models in (preferred, fallbacks):
+        if not models:
+            continue
+        if models is fallbacks:
+            print(f"\n   ⚠️  All preferred models failed. Trying any available model...")
+        with ThreadPoolExecutor(max_workers=len(models)) as pool:
+            results = list(pool.map(functools.partial(_generate, genai), models))
+        for model_name, outcome in zip(models, results):
+            if not _report(model_name, outcome):
+                last_error = outcome
+                result["errors"].append({"step": "generate", "model": model_name, "error": str(outcome)})
+                continue
+            result["winner"] = model_name
+            print(f"""
+✅ RECOMMENDED MODEL: {model_name}
+   Update your config.py to use: GEMINI_MODEL = '{model_name}'
+
+{RULE}
+SETUP TEST COMPLETE - YOUR CONFIGURATION IS WORKING!
+{RULE}""")
+            return model_name
+
+    print(f"""
+❌ ALL MODELS FAILED TO GENERATE CONTENT
+
+Last error encountered:
+   {last_error}
+
+Possible issues:
+   1. API key might not have proper permissions
+   2. API key might be restricted to certain models
+   3. Your account might need to enable Gemini API access
+   4. There might be a temporary service issue
+
+Troubleshooting steps:
+   1. Visit https://aistudio.google.com/
+   2. Try generating content in the web UI
+   3. Check your API key settings and quotas
+   4. Create a new API key if needed""")
+    return None
+
+
+def main(argv: List[str] = None) -> int:
+    """Command line entry point for the setup scripts; returns the exit status"""
+    parser = argparse.ArgumentParser(description="Verify the Gemini API setup")
+    parser.add_argument('--json', action='store_true',
+                        help="print one JSON summary instead of the human-readable report")
+    args = parser.parse_args(argv)
+
+    if not args.json:
+        return 0 if probe() else 1
+
+    result = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        probe(result=result)
+    print(json.dumps(result, separators=(',', ':')))
+    return 0 if result["winner"] else 1
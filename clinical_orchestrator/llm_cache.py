@@ -0,0 +1,223 @@
+"""
+LLM Response Cache
+Stores results of Gemini-backed features keyed by a content hash so
+identical requests skip the API round-trip entirely, plus an optional
+embedding-similarity cache for near-duplicate brief notes
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import google.generativeai as genai
+import orjson
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(payload: Dict[str, Any]) -> str:
+    """Build a deterministic SHA-256 key from a JSON-serializable payload"""
+    encoded = orjson.dumps(payload, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS, default=str)
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class LLMCache:
+    """
+    In-memory LRU cache with per-entry TTL
+    Async interface so a shared backend (Redis, diskcache) can be swapped in
+    """
+    def __init__(self, max_entries: int = 256, default_ttl: int = 3600):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = asyncio.Lock()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for key, or None on a miss"""
+        async with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    async def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        """Store a value, evicting the least recently used entry when full"""
+        async with self._lock:
+            expires_at = time.monotonic() + (ttl if ttl is not None else self.default_ttl)
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    async def get_or_set(self, key: str, compute: Callable[[], Awaitable[Any]],
+                         ttl: Optional[int] = None) -> Any:
+        """
+        Return the cached value for key, computing and storing it on a miss
+        Concurrent misses for the same key share one computation instead of each calling it;
+        if that computation's caller is cancelled, a waiter takes over instead of failing
+        """
+        while True:
+            value = await self.get(key)
+            if value is not None:
+                return value
+            
+            pending = self._inflight.get(key)
+            if pending is None:
+                break
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                # Only swallow the owner's cancellation, never this task's own
+                if not pending.cancelled() or asyncio.current_task().cancelling():
+                    raise
+        
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await compute()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Waiters re-raise it; don't warn when there are none
+            raise
+        else:
+            await self.set(key, value, ttl)
+            future.set_result(value)
+            return value
+        finally:
+            del self._inflight[key]
+
+    async def clear(self) -> None:
+        """Drop all cached entries"""
+        async with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return cache hit/miss statistics"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._entries)
+        }
+
+
+class SemanticCache:
+    """
+    Embedding-similarity cache for near-duplicate free-text inputs
+    Entries are grouped by namespace so only requests sharing the same
+    surrounding context (patient, documents) can match each other
+    """
+    def __init__(self, threshold: float = 0.95, max_entries: int = 256,
+                 default_ttl: int = 3600):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._entries: List[tuple] = []  # (namespace, embedding, expires_at, value)
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    async def embed(self, text: str) -> Optional[List[float]]:
+        """
+        Return a unit-length embedding for text, or None if embedding fails
+        Pass the result to lookup and store so a miss embeds its text only once
+        """
+        try:
+            response = await asyncio.to_thread(
+                genai.embed_content, model=Config.EMBEDDING_MODEL, content=text
+            )
+        except Exception as e:
+            logger.warning("Semantic cache embedding failed: %s", e)
+            return None
+        
+        vector = response["embedding"]
+        norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+        return [x / norm for x in vector]
+
+    async def lookup(self, text: str, namespace: str = "",
+                     embedding: Optional[List[float]] = None) -> Optional[Any]:
+        """Return the cached value for the most similar stored text above threshold"""
+        if embedding is None:
+            embedding = await self.embed(text)
+        if embedding is None:
+            self.misses += 1
+            return None
+        
+        async with self._lock:
+            now = time.monotonic()
+            self._entries = [entry for entry in self._entries if entry[2] > now]
+            
+            best_value, best_score = None, self.threshold
+            for entry_namespace, entry_embedding, _, value in self._entries:
+                if entry_namespace != namespace:
+                    continue
+                score = sum(a * b for a, b in zip(embedding, entry_embedding))
+                if score >= best_score:
+                    best_value, best_score = value, score
+            
+            if best_value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return best_value
+
+    async def store(self, text: str, value: Any, namespace: str = "",
+                    ttl: Optional[int] = None, embedding: Optional[List[float]] = None) -> None:
+        """Store value under text's embedding (embedding text unless it is given)"""
+        if embedding is None:
+            embedding = await self.embed(text)
+        if embedding is None:
+            return
+        
+        async with self._lock:
+            expires_at = time.monotonic() + (ttl if ttl is not None else self.default_ttl)
+            self._entries.append((namespace, embedding, expires_at, value))
+            if len(self._entries) > self.max_entries:
+                self._entries = self._entries[-self.max_entries:]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return cache hit/miss statistics"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._entries)
+        }
+
+
+# Global response caches shared by the API endpoints
+llm_cache = LLMCache(
+    max_entries=Config.LLM_CACHE_MAX_ENTRIES,
+    default_ttl=Config.LLM_CACHE_TTL_SECONDS
+)
+
+# Prompt-level cache for agent calls: an identical prompt reuses the earlier response text
+prompt_cache = LLMCache(
+    max_entries=Config.LLM_CACHE_MAX_ENTRIES,
+    default_ttl=Config.LLM_CACHE_TTL_SECONDS
+)
+
+semantic_cache = SemanticCache(
+    threshold=Config.SEMANTIC_CACHE_THRESHOLD,
+    max_entries=Config.LLM_CACHE_MAX_ENTRIES,
+    default_ttl=Config.LLM_CACHE_TTL_SECONDS
+)
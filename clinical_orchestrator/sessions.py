@@ -0,0 +1,67 @@
+"""
+Session Store
+Keeps one DocWeaverOrchestrator per client session so concurrent users
+don't share (and overwrite) each other's workflow state
+"""
+import time
+from collections import OrderedDict
+from typing import Dict, Any
+
+from config import Config
+from orchestrator import DocWeaverOrchestrator
+
+# Session used when a client doesn't send an X-Session-Id header
+DEFAULT_SESSION_ID = "default"
+
+
+class SessionStore:
+    """
+    LRU store of orchestrators with an idle TTL
+    Sessions are created on first touch and evicted when idle or when full
+    """
+    def __init__(self, max_sessions: int = 1000, ttl: int = 3600):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, session_id: str) -> DocWeaverOrchestrator:
+        """Return the orchestrator for session_id, creating it if needed"""
+        now = time.monotonic()
+        self._evict_expired(now)
+
+        entry = self._sessions.get(session_id)
+        orchestrator = entry[1] if entry is not None else DocWeaverOrchestrator()
+        self._sessions[session_id] = (now + self.ttl, orchestrator)
+        self._sessions.move_to_end(session_id)
+
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        return orchestrator
+
+    def discard(self, session_id: str) -> None:
+        """Drop a session and its workflow state"""
+        self._sessions.pop(session_id, None)
+
+    def _evict_expired(self, now: float) -> None:
+        """Remove sessions idle for longer than the TTL"""
+        # Entries are ordered by last use, so expired ones sit at the front
+        while self._sessions:
+            expires_at, _ = next(iter(self._sessions.values()))
+            if expires_at > now:
+                break
+            self._sessions.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return session store statistics"""
+        return {
+            "active_sessions": len(self._sessions),
+            "max_sessions": self.max_sessions
+        }
+
+
+# Global session store (per worker process): each client gets its own orchestrator,
+# selected by the X-Session-Id header; requests without it share the default session
+sessions = SessionStore(
+    max_sessions=Config.MAX_SESSIONS,
+    ttl=Config.SESSION_TTL_SECONDS
+)
@@ -5,35 +5,89 @@ Gemini API Calls #6-9
 Optimized for Gemini 3 Flash free tier rate limiting
 """
 import asyncio
+import logging
+from operator import itemgetter
 from typing import Dict, List, Any
-import json
+import orjson
 
 from config import Config
-from document_processor import rate_limiter
+from document_processor import (
+    rate_limiter, cached_generate, compact_json,
+    batch_extract, object_schema, json_schema_config, STRING_SCHEMA
+)
 
+logger = logging.getLogger(__name__)
 
-class TemporalAnalyzer:
-    """Analyzes temporal relationships and causality in medical data"""
-    
-    def __init__(self):
-        self.model = Config.initialize_gemini()
-        self.rate_limiter = rate_limiter
-    
-    async def identify_new_events(self, documents: List[Dict[str, Any]], last_visit_date: str = None) -> Dict[str, Any]:
-        """
-        Gemini API Call #6: Identify new events since last visit
-        """
-        await self.rate_limiter.acquire()
-        Config.increment_api_calls()
-        
-        doc_summary = self._prepare_document_summary(documents)
-        
-        prompt = f"""Analyze these medical documents and identify NEW events since the last visit.
 
-Last Visit Date: {last_visit_date or "3 months ago"}
+# Fused temporal analysis: the four analyses answered in one JSON-mode call
+# No response schema: the API emits schema keys alphabetically, which would put
+# priorities before the findings it ranks, so the reply follows the task order instead
+TEMPORAL_ANALYSIS_TASKS = {
+    "new_events": """Identify NEW events since the last visit date: new diagnoses or conditions,
+new abnormal test results, ER visits or hospitalizations, medications started or stopped,
+new specialist consultations.
+Value: a list of objects with event, date (YYYY-MM-DD), severity (critical/urgent/routine)
+and source_document""",
+    "trends": """For each lab test in the lab results showing a trend over time: the test name,
+direction (improving/worsening/stable), values over time (oldest to most recent),
+clinical significance (high/medium/low) and what it means clinically.
+Value: a list of objects with test_name, direction, values_over_time (list of strings),
+clinical_significance and interpretation; empty list if there are no lab results""",
+    "causal_links": """Identify CAUSAL RELATIONSHIPS between the chronological events: drug-drug
+interactions (e.g., NSAID + ACE inhibitor → kidney function change), treatment effects
+(medication → lab value changes), disease progression, medication side effects, procedure
+complications. For each: the cause event and effect event with dates, the mechanism (HOW
+the cause led to the effect), confidence (high/medium/low), clinical importance
+(critical/important/notable) and the recommended action.
+Value: a list of objects with cause_event, effect_event, mechanism, confidence,
+clinical_importance and recommendation""",
+    "summary": """An overall narrative of the patient's clinical course.
+Value: plain text""",
+    "priorities": """Prioritize the findings from the tasks above for physician review.
+critical: requires immediate attention (life-threatening, severe deterioration).
+urgent: needs attention soon (significant changes, new concerning findings).
+routine: monitor at next visit (stable, expected changes).
+Value: an object with critical, urgent and routine, each a list of objects with
+finding, rationale and suggested_action"""
+}
 
-Documents:
-{doc_summary}
+PRIORITY_FINDING_SCHEMA = {
+    "type": "array",
+    "items": object_schema(finding=STRING_SCHEMA, rationale=STRING_SCHEMA, suggested_action=STRING_SCHEMA)
+}
+NEW_EVENTS_SCHEMA = {"type": "array", "items": object_schema(
+    event=STRING_SCHEMA, date=STRING_SCHEMA, severity=STRING_SCHEMA, source_document=STRING_SCHEMA
+)}
+LAB_TRENDS_SCHEMA = {"type": "array", "items": object_schema(
+    test_name=STRING_SCHEMA,
+    direction=STRING_SCHEMA,
+    values_over_time={"type": "array", "items": STRING_SCHEMA},
+    clinical_significance=STRING_SCHEMA,
+    interpretation=STRING_SCHEMA
+)}
+CAUSAL_LINKS_SCHEMA = {"type": "array", "items": object_schema(
+    cause_event=STRING_SCHEMA,
+    effect_event=STRING_SCHEMA,
+    mechanism=STRING_SCHEMA,
+    confidence=STRING_SCHEMA,
+    clinical_importance=STRING_SCHEMA,
+    recommendation=STRING_SCHEMA
+)}
+PRIORITIES_SCHEMA = object_schema(
+    critical=PRIORITY_FINDING_SCHEMA,
+    urgent=PRIORITY_FINDING_SCHEMA,
+    routine=PRIORITY_FINDING_SCHEMA
+)
+# Structured output for the separate (fused=False) analysis calls
+NEW_EVENTS_CONFIG = json_schema_config(object_schema(new_events=NEW_EVENTS_SCHEMA))
+LAB_TRENDS_CONFIG = json_schema_config(object_schema(trends=LAB_TRENDS_SCHEMA))
+CAUSAL_LINKS_CONFIG = json_schema_config(object_schema(causal_links=CAUSAL_LINKS_SCHEMA, summary=STRING_SCHEMA))
+PRIORITIZE_CHANGES_CONFIG = json_schema_config(PRIORITIES_SCHEMA)
+
+
+# Prompt templates, filled with str.format_map (literal braces are doubled)
+# Patient data goes last so the fixed instructions form a reusable prompt prefix
+NEW_EVENTS_PROMPT = """Analyze the medical documents below and identify NEW events since the last visit.
 
 Identify:
 1. New diagnoses or conditions
@@ -54,42 +108,14 @@ Return a JSON object:
     ]
 }}
 
-Return ONLY valid JSON, no other text."""
-        
-        try:
-            response = await asyncio.to_thread(
-                self.model.generate_content, prompt
-            )
-            return self._parse_json_response(response.text)
-        except Exception as e:
-            print(f"❌ Error in identify_new_events: {str(e)}")
-            return {"new_events": [], "error": str(e)}
-    
-    async def detect_lab_trends(self, documents: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """
-        Gemini API Call #7: Detect trends in lab values over time
-        """
-        # Extract all lab data
-        lab_data = []
-        for doc in documents:
-            if doc.get('document_type') == 'lab_report':
-                extracted = doc.get('extracted_data', {})
-                if 'error' not in extracted:
-                    lab_data.append({
-                        'date': extracted.get('test_date'),
-                        'tests': extracted.get('tests', [])
-                    })
-        
-        if not lab_data:
-            return {"trends": [], "message": "No lab data available"}
-        
-        await self.rate_limiter.acquire()
-        Config.increment_api_calls()
-        
-        prompt = f"""Analyze these lab results over time and identify important trends.
+Return ONLY valid JSON, no other text.
 
-Lab Results (chronological):
-{json.dumps(lab_data, indent=2)}
+Last Visit Date: {last_visit_date}
+
+Documents:
+{doc_summary}"""
+
+LAB_TRENDS_PROMPT = """Analyze the lab results below over time and identify important trends.
 
 For each test showing a trend:
 1. Identify the test name
@@ -110,40 +136,12 @@ Return a JSON object:
     ]
 }}
 
-Return ONLY valid JSON, no other text."""
-        
-        try:
-            response = await asyncio.to_thread(
-                self.model.generate_content, prompt
-            )
-            return self._parse_json_response(response.text)
-        except Exception as e:
-            print(f"❌ Error in detect_lab_trends: {str(e)}")
-            return {"trends": [], "error": str(e)}
-    
-    async def establish_causal_relationships(self, documents: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """
-        Gemini API Call #8: Establish causal relationships between events
-        
-        THIS IS THE KEY DIFFERENTIATOR - Temporal causality detection
-        "Event A led to Event B" - proves sophisticated reasoning
-        """
-        await self.rate_limiter.acquire()
-        Config.increment_api_calls()
-        
-        events = self._extract_all_events(documents)
-        
-        # If no events extracted, return empty
-        if not events:
-            return {
-                "causal_links": [],
-                "summary": "Insufficient data to establish causal relationships"
-            }
-        
-        prompt = f"""Analyze these chronological medical events and identify CAUSAL RELATIONSHIPS.
+Return ONLY valid JSON, no other text.
 
-Events (chronological order):
-{json.dumps(events, indent=2)}
+Lab Results (chronological):
+{lab_data}"""
+
+CAUSAL_LINKS_PROMPT = """Analyze the chronological medical events below and identify CAUSAL RELATIONSHIPS.
 
 Look for:
 1. Drug-drug interactions (e.g., NSAID + ACE inhibitor → kidney function change)
@@ -174,34 +172,12 @@ Return a JSON object:
     "summary": "overall narrative of patient's clinical course"
 }}
 
-Return ONLY valid JSON, no other text."""
-        
-        try:
-            response = await asyncio.to_thread(
-                self.model.generate_content, prompt
-            )
-            return self._parse_json_response(response.text)
-        except Exception as e:
-            print(f"❌ Error in establish_causal_relationships: {str(e)}")
-            return {"causal_links": [], "summary": "Error analyzing causality", "error": str(e)}
-    
-    async def prioritize_changes(self, new_events: Dict, trends: Dict, causal_links: Dict) -> Dict[str, Any]:
-        """
-        Gemini API Call #9: Prioritize and categorize all changes
-        """
-        await self.rate_limiter.acquire()
-        Config.increment_api_calls()
-        
-        combined_data = {
-            "new_events": new_events,
-            "trends": trends,
-            "causal_links": causal_links
-        }
-        
-        prompt = f"""Review all clinical changes and prioritize them for physician review.
+Return ONLY valid JSON, no other text.
 
-Data:
-{json.dumps(combined_data, indent=2)}
+Events (chronological order):
+{events}"""
+
+PRIORITIZE_CHANGES_PROMPT = """Review all clinical changes below and prioritize them for physician review.
 
 Categorize each finding:
 - CRITICAL: Requires immediate attention (life-threatening, severe deterioration)
@@ -232,15 +208,102 @@ Return a JSON object:
     ]
 }}
 
-Return ONLY valid JSON, no other text."""
+Return ONLY valid JSON, no other text.
+
+Data:
+{combined_data}"""
+
+
+class TemporalAnalyzer:
+    """Analyzes temporal relationships and causality in medical data"""
+    
+    def __init__(self):
+        self.model = Config.initialize_gemini()
+        self.rate_limiter = rate_limiter
+    
+    def _log_error(self, method_name: str, error: Exception) -> None:
+        """Report a failed analysis step (full traceback only at DEBUG level)"""
+        logger.error("Error in %s: %s: %s", method_name, type(error).__name__, error,
+                     exc_info=logger.isEnabledFor(logging.DEBUG))
+    
+    async def identify_new_events(self, documents: List[Dict[str, Any]], last_visit_date: str = None) -> Dict[str, Any]:
+        """
+        Gemini API Call #6: Identify new events since last visit
+        """
+        doc_summary = self._prepare_document_summary(documents)
+        
+        prompt = NEW_EVENTS_PROMPT.format_map({
+            "last_visit_date": last_visit_date or "3 months ago",
+            "doc_summary": doc_summary
+        })
         
         try:
-            response = await asyncio.to_thread(
-                self.model.generate_content, prompt
-            )
-            return self._parse_json_response(response.text)
+            response_text = await cached_generate(self.model, prompt, generation_config=NEW_EVENTS_CONFIG)
+            return self._parse_json_response(response_text)
         except Exception as e:
-            print(f"❌ Error in prioritize_changes: {str(e)}")
+            self._log_error("identify_new_events", e)
+            return {"new_events": [], "error": str(e)}
+    
+    async def detect_lab_trends(self, documents: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Gemini API Call #7: Detect trends in lab values over time
+        """
+        lab_data = self._extract_lab_data(documents)
+        
+        if not lab_data:
+            return {"trends": [], "message": "No lab data available"}
+        
+        prompt = LAB_TRENDS_PROMPT.format_map({"lab_data": compact_json(lab_data)})
+        
+        try:
+            response_text = await cached_generate(self.model, prompt, generation_config=LAB_TRENDS_CONFIG)
+            return self._parse_json_response(response_text)
+        except Exception as e:
+            self._log_error("detect_lab_trends", e)
+            return {"trends": [], "error": str(e)}
+    
+    async def establish_causal_relationships(self, documents: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Gemini API Call #8: Establish causal relationships between events
+        
+        THIS IS THE KEY DIFFERENTIATOR - Temporal causality detection
+        "Event A led to Event B" - proves sophisticated reasoning
+        """
+        events = self._extract_all_events(documents)
+        
+        # If no events extracted, return empty
+        if not events:
+            return {
+                "causal_links": [],
+                "summary": "Insufficient data to establish causal relationships"
+            }
+        
+        prompt = CAUSAL_LINKS_PROMPT.format_map({"events": compact_json(events)})
+        
+        try:
+            response_text = await cached_generate(self.model, prompt, generation_config=CAUSAL_LINKS_CONFIG)
+            return self._parse_json_response(response_text)
+        except Exception as e:
+            self._log_error("establish_causal_relationships", e)
+            return {"causal_links": [], "summary": "Error analyzing causality", "error": str(e)}
+    
+    async def prioritize_changes(self, new_events: Dict, trends: Dict, causal_links: Dict) -> Dict[str, Any]:
+        """
+        Gemini API Call #9: Prioritize and categorize all changes
+        """
+        combined_data = {
+            "new_events": new_events,
+            "trends": trends,
+            "causal_links": causal_links
+        }
+        
+        prompt = PRIORITIZE_CHANGES_PROMPT.format_map({"combined_data": compact_json(combined_data)})
+        
+        try:
+            response_text = await cached_generate(self.model, prompt, generation_config=PRIORITIZE_CHANGES_CONFIG)
+            return self._parse_json_response(response_text)
+        except Exception as e:
+            self._log_error("prioritize_changes", e)
             return {"critical": [], "urgent": [], "routine": [], "error": str(e)}
     
     async def create_timeline(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
@@ -286,40 +349,90 @@ Return ONLY valid JSON, no other text."""
                     "document_name": doc.get('file_name', '')
                 })
         
-        # Sort by date, handling None values
-        timeline.sort(key=lambda x: x.get('date') or '9999-12-31')
+        # Sort by ISO date (only dated events are added)
+        timeline.sort(key=itemgetter('date'))
         
         return timeline
     
-    async def analyze_all(self, documents: List[Dict[str, Any]], last_visit_date: str = None) -> Dict[str, Any]:
+    async def analyze_all_fused(self, documents: List[Dict[str, Any]], last_visit_date: str = None) -> Dict[str, Any]:
+        """
+        Gemini API Call #6: New events, lab trends, causal links and priorities in one JSON request
+        Replaces calls #6-9, which each re-sent overlapping document context
+        """
+        context = (
+            f"Last Visit Date: {last_visit_date or '3 months ago'}\n\n"
+            f"Documents:\n{self._prepare_document_summary(documents)}\n\n"
+            f"Lab Results (chronological):\n{compact_json(self._extract_lab_data(documents))}\n\n"
+            f"Other Events (chronological order):\n{compact_json(self._extract_all_events(documents, include_labs=False))}"
+        )
+        
+        try:
+            logger.debug("Calling Gemini API for fused temporal analysis")
+            result = await batch_extract(self.model, context, TEMPORAL_ANALYSIS_TASKS)
+            logger.debug("Gemini response received for fused temporal analysis")
+        except Exception as e:
+            self._log_error("analyze_all_fused", e)
+            return {
+                "new_events": {"new_events": [], "error": str(e)},
+                "trends": {"trends": [], "error": str(e)},
+                "causal_analysis": {"causal_links": [], "summary": "Error analyzing causality", "error": str(e)},
+                "priorities": {"critical": [], "urgent": [], "routine": [], "error": str(e)}
+            }
+        
+        # Without a response schema, fall back to empty values for any malformed key
+        lists = {key: result[key] if isinstance(result[key], list) else []
+                 for key in ("new_events", "trends", "causal_links")}
+        priorities = result["priorities"] if isinstance(result["priorities"], dict) else {}
+        return {
+            "new_events": {"new_events": lists["new_events"]},
+            "trends": {"trends": lists["trends"]},
+            "causal_analysis": {
+                "causal_links": lists["causal_links"],
+                "summary": result["summary"] if isinstance(result["summary"], str) else ""
+            },
+            "priorities": {level: priorities.get(level) or [] for level in ("critical", "urgent", "routine")}
+        }
+    
+    async def analyze_all(self, documents: List[Dict[str, Any]], last_visit_date: str = None,
+                          fused: bool = True) -> Dict[str, Any]:
         """
         Run complete temporal analysis pipeline
-        Total: 4 Gemini API calls (#6, #7, #8, #9)
+        fused=True: one JSON-mode Gemini call (#6) alongside the timeline
+        fused=False: separate calls in dependency tiers
+          Tier 1: new events, lab trends, causal links and timeline are independent and run concurrently
+          Tier 2: prioritization needs the tier 1 results
+          Total: 4 Gemini API calls (#6, #7, #8, #9)
         """
-        print("\n🧠 Running temporal analysis...")
+        logger.info("Running temporal analysis")
         
-        # Run all analyses
-        print("   🔍 Identifying new events...")
-        new_events = await self.identify_new_events(documents, last_visit_date)
-        print(f"   ✓ New events identified (Total API calls: {Config.get_api_call_count()})")
+        if fused:
+            analysis, timeline = await asyncio.gather(
+                self.analyze_all_fused(documents, last_visit_date),
+                self.create_timeline(documents)
+            )
+            logger.info("Temporal analysis complete")
+            return {**analysis, "timeline": timeline}
         
-        print("   📊 Detecting lab trends...")
-        trends = await self.detect_lab_trends(documents)
-        print(f"   ✓ Lab trends detected (Total API calls: {Config.get_api_call_count()})")
+        semaphore = asyncio.Semaphore(Config.MAX_CONCURRENT_LLM_CALLS)
         
-        print("   🔗 Establishing causal relationships...")
-        causal_links = await self.establish_causal_relationships(documents)
-        print(f"   ✓ Causal relationships established (Total API calls: {Config.get_api_call_count()})")
+        async def bounded(coro):
+            async with semaphore:
+                return await coro
         
-        print("   ⚖️  Prioritizing changes...")
-        priorities = await self.prioritize_changes(new_events, trends, causal_links)
-        print(f"   ✓ Changes prioritized (Total API calls: {Config.get_api_call_count()})")
+        logger.debug("Identifying new events, lab trends, causal relationships and timeline")
+        new_events, trends, causal_links, timeline = await asyncio.gather(
+            bounded(self.identify_new_events(documents, last_visit_date)),
+            bounded(self.detect_lab_trends(documents)),
+            bounded(self.establish_causal_relationships(documents)),
+            bounded(self.create_timeline(documents))
+        )
+        logger.debug("Tier 1 analyses complete (total API calls: %d)", Config.get_api_call_count())
         
-        print("   📅 Creating timeline...")
-        timeline = await self.create_timeline(documents)
-        print(f"   ✓ Timeline created")
+        logger.debug("Prioritizing changes")
+        priorities = await self.prioritize_changes(new_events, trends, causal_links)
+        logger.debug("Changes prioritized (total API calls: %d)", Config.get_api_call_count())
         
-        print(f"✅ Temporal analysis complete!\n")
+        logger.info("Temporal analysis complete")
         
         return {
             "new_events": new_events,
@@ -348,8 +461,24 @@ Return ONLY valid JSON, no other text."""
             summary.append(f"- {file_name} ({doc_type}, {date})")
         return "\n".join(summary) if summary else "No valid documents found"
     
-    def _extract_all_events(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Extract all events from documents in chronological order"""
+    def _extract_lab_data(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Collect dated test results from all lab reports"""
+        lab_data = []
+        for doc in documents:
+            if doc.get('document_type') == 'lab_report':
+                extracted = doc.get('extracted_data', {})
+                if 'error' not in extracted:
+                    lab_data.append({
+                        'date': extracted.get('test_date'),
+                        'tests': extracted.get('tests', [])
+                    })
+        return lab_data
+    
+    def _extract_all_events(self, documents: List[Dict[str, Any]], include_labs: bool = True) -> List[Dict[str, Any]]:
+        """
+        Extract all events from documents in chronological order
+        include_labs=False leaves out lab results for prompts that already carry the lab series
+        """
         events = []
         
         for doc in documents:
@@ -361,6 +490,8 @@ Return ONLY valid JSON, no other text."""
                 continue
             
             if doc_type == 'lab_report':
+                if not include_labs:
+                    continue
                 date = extracted.get('test_date')
                 tests = extracted.get('tests', [])
                 for test in tests:
@@ -406,24 +537,15 @@ Return ONLY valid JSON, no other text."""
                     "description": f"{extracted.get('specialty', 'Specialist')} consultation: {extracted.get('reason_for_consult', 'Consultation')}"
                 })
         
-        # Sort by date, with proper handling of None/Unknown values
-        events.sort(key=lambda x: x.get('date') if x.get('date') and x.get('date') != 'Unknown' else '9999-12-31')
+        # Sort by date; every event has one, 'Unknown' sorts last
+        events.sort(key=lambda x: '9999-12-31' if x['date'] == 'Unknown' else x['date'])
         
         return events
     
     def _parse_json_response(self, response_text: str) -> Dict[str, Any]:
-        """Parse JSON from Gemini response"""
+        """Parse a JSON-mode Gemini response"""
         try:
-            json_text = response_text.strip()
-            if json_text.startswith("```json"):
-                json_text = json_text[7:]
-            if json_text.startswith("```"):
-                json_text = json_text[3:]
-            if json_text.endswith("```"):
-                json_text = json_text[:-3]
-            json_text = json_text.strip()
-            
-            return json.loads(json_text)
+            return orjson.loads(response_text)
         except Exception as e:
-            print(f"⚠️  JSON parsing warning: {str(e)}")
+            logger.warning("JSON parsing warning: %s", e)
             return {"error": f"Failed to parse JSON: {str(e)}", "raw": response_text[:200]}
\ No newline at end of file
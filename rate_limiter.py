@@ -1,33 +1,40 @@
 # Add to your project root: rate_limiter.py
 import asyncio
-from datetime import datetime, timedelta
-from collections import deque
+import logging
+import time
+
+logger = logging.getLogger(__name__)
 
 class GeminiRateLimiter:
     def __init__(self, max_calls=4, time_window=60):
         """
         max_calls=4 to stay safely under 5/min limit
         time_window=60 seconds
+        Token bucket on the monotonic clock: starts full, refills max_calls per time_window
         """
         self.max_calls = max_calls
         self.time_window = time_window
-        self.call_times = deque(maxlen=max_calls)
-    
+        self.tokens = float(max_calls)
+        self.last_refill = time.monotonic()
+        self._lock = asyncio.Lock()
+
     async def acquire(self):
-        """Wait if necessary before making API call"""
-        now = datetime.now()
-        
-        # If we have max_calls in the window, wait
-        if len(self.call_times) >= self.max_calls:
-            oldest_call = self.call_times[0]
-            time_since_oldest = (now - oldest_call).total_seconds()
-            
-            if time_since_oldest < self.time_window:
-                wait_time = self.time_window - time_since_oldest + 1
-                print(f"⏳ Rate limit: waiting {wait_time:.1f}s...")
-                await asyncio.sleep(wait_time)
-        
-        self.call_times.append(datetime.now())
+        """
+        Wait if necessary before making API call
+        The token is reserved under the lock (the balance may go negative) and the
+        wait happens outside it, so concurrent callers get staggered slots
+        """
+        async with self._lock:
+            now = time.monotonic()
+            elapsed = now - self.last_refill
+            self.tokens = min(self.max_calls, self.tokens + elapsed * self.max_calls / self.time_window)
+            self.last_refill = now
+            self.tokens -= 1
+            wait_time = -self.tokens * self.time_window / self.max_calls if self.tokens < 0 else 0
+
+        if wait_time:
+            logger.info("Rate limit: waiting %.1fs before next API call", wait_time)
+            await asyncio.sleep(wait_time)
 
 # Global rate limiter
-rate_limiter = GeminiRateLimiter(max_calls=4, time_window=60)
\ No newline at end of file
+rate_limiter = GeminiRateLimiter(max_calls=4, time_window=60)
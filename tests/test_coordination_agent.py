@@ -0,0 +1,48 @@
+"""
+Tests for decoding the care coordination needs reply
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "clinical_orchestrator"))
+
+from coordination_agent import CareCoordinationAgent
+
+
+def parse(response_text):
+    # _parse_coordination_needs needs no agent state, so skip building the Gemini model
+    return CareCoordinationAgent.__new__(CareCoordinationAgent)._parse_coordination_needs(response_text)
+
+
+def test_numeric_timeframe_is_kept_as_text():
+    needs = parse('{"follow_ups": [{"timeframe": 3, "reason": "A1C recheck"}]}')
+    assert "error" not in needs
+    assert needs["follow_ups"] == [{"timeframe": "3", "reason": "A1C recheck", "required_prep": ""}]
+
+
+def test_invalid_item_is_dropped_without_losing_the_rest():
+    needs = parse(
+        '{"referrals": [{"specialty": ["eye", "kidney"]}, {"specialty": "Ophthalmology"}],'
+        ' "orders": [{"type": "lab", "description": "BMP"}],'
+        ' "patient_communication_needed": true}'
+    )
+    assert [referral["specialty"] for referral in needs["referrals"]] == ["Ophthalmology"]
+    assert needs["orders"][0]["description"] == "BMP"
+    assert needs["patient_communication_needed"] is True
+
+
+def test_nulls_and_missing_fields_get_defaults():
+    needs = parse('```json\n{"referrals": [{"specialty": "Nephrology", "urgency": null}]}\n```')
+    assert needs["referrals"][0]["urgency"] == "routine"
+    assert needs["follow_ups"] == [] and needs["orders"] == []
+
+
+def test_non_list_section_is_ignored():
+    needs = parse('{"orders": "none", "follow_ups": [{"timeframe": "2 weeks"}]}')
+    assert needs["orders"] == []
+    assert needs["follow_ups"][0]["timeframe"] == "2 weeks"
+
+
+def test_undecodable_reply_reports_an_error():
+    needs = parse("not json")
+    assert "error" in needs
@@ -0,0 +1,133 @@
+"""
+Tests for the in-memory LLM response cache
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "clinical_orchestrator"))
+
+from llm_cache import LLMCache, make_cache_key
+
+
+def test_make_cache_key_ignores_key_order():
+    assert make_cache_key({"a": 1, "b": [2, 3]}) == make_cache_key({"b": [2, 3], "a": 1})
+    assert make_cache_key({"a": 1}) != make_cache_key({"a": 2})
+
+
+def test_get_and_set():
+    async def run():
+        cache = LLMCache()
+        assert await cache.get("key") is None
+        await cache.set("key", {"value": 1})
+        assert await cache.get("key") == {"value": 1}
+        return cache.get_stats()
+    
+    stats = asyncio.run(run())
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+
+def test_expired_entries_are_misses():
+    async def run():
+        cache = LLMCache(default_ttl=3600)
+        await cache.set("key", "value", ttl=0)
+        return await cache.get("key"), cache.get_stats()
+    
+    value, stats = asyncio.run(run())
+    assert value is None
+    assert stats["entries"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    async def run():
+        cache = LLMCache(max_entries=2)
+        await cache.set("a", 1)
+        await cache.set("b", 2)
+        await cache.get("a")  # "b" is now least recently used
+        await cache.set("c", 3)
+        return [await cache.get(key) for key in ("a", "b", "c")]
+    
+    assert asyncio.run(run()) == [1, None, 3]
+
+
+def test_get_or_set_shares_one_computation():
+    calls = []
+    
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+    
+    async def run():
+        cache = LLMCache()
+        results = await asyncio.gather(*(cache.get_or_set("key", compute) for _ in range(5)))
+        return results, await cache.get_or_set("key", compute)
+    
+    results, cached = asyncio.run(run())
+    assert results == ["result"] * 5
+    assert cached == "result"
+    assert len(calls) == 1
+
+
+def test_get_or_set_shares_errors_without_caching_them():
+    calls = []
+    
+    async def fail():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+    
+    async def run():
+        cache = LLMCache()
+        results = await asyncio.gather(*(cache.get_or_set("key", fail) for _ in range(3)),
+                                       return_exceptions=True)
+        return results, await cache.get("key")
+    
+    results, cached = asyncio.run(run())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert cached is None
+    assert len(calls) == 1
+
+
+def test_waiter_takes_over_when_the_first_caller_is_cancelled():
+    calls = []
+    
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return len(calls)
+    
+    async def run():
+        cache = LLMCache()
+        first = asyncio.ensure_future(cache.get_or_set("key", compute))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.ensure_future(cache.get_or_set("key", compute))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await waiter
+    
+    assert asyncio.run(run()) == 2
+    assert len(calls) == 2
+
+
+def test_cancelled_waiter_does_not_cancel_the_computation():
+    async def compute():
+        await asyncio.sleep(0.03)
+        return "result"
+    
+    async def run():
+        cache = LLMCache()
+        first = asyncio.ensure_future(cache.get_or_set("key", compute))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.ensure_future(cache.get_or_set("key", compute))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        return await first
+    
+    assert asyncio.run(run()) == "result"
@@ -0,0 +1,66 @@
+"""
+Tests for the shared Gemini token bucket rate limiter
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "clinical_orchestrator"))
+
+import document_processor
+from document_processor import GeminiRateLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Fake monotonic clock; asyncio.sleep records its delay and advances nothing"""
+    state = {"now": 1000.0, "sleeps": []}
+    
+    async def fake_sleep(delay):
+        state["sleeps"].append(delay)
+    
+    monkeypatch.setattr(document_processor.time, "monotonic", lambda: state["now"])
+    monkeypatch.setattr(document_processor.asyncio, "sleep", fake_sleep)
+    return state
+
+
+def acquire_all(limiter, count):
+    async def run():
+        await asyncio.gather(*(limiter.acquire() for _ in range(count)))
+    asyncio.run(run())
+
+
+def test_burst_up_to_max_calls_does_not_wait(clock):
+    limiter = GeminiRateLimiter(max_calls=4, time_window=60)
+    acquire_all(limiter, 4)
+    assert clock["sleeps"] == []
+    assert limiter.get_stats()["total_waits"] == 0
+
+
+def test_concurrent_callers_get_staggered_slots(clock):
+    limiter = GeminiRateLimiter(max_calls=2, time_window=60)
+    acquire_all(limiter, 5)
+    # Two calls from the full bucket, then one every 30s
+    assert sorted(clock["sleeps"]) == pytest.approx([30, 60, 90])
+    stats = limiter.get_stats()
+    assert stats["total_waits"] == 3
+    assert stats["total_wait_time"] == pytest.approx(180)
+
+
+def test_tokens_refill_over_time(clock):
+    limiter = GeminiRateLimiter(max_calls=2, time_window=60)
+    acquire_all(limiter, 2)
+    clock["now"] += 30  # One token back
+    acquire_all(limiter, 1)
+    assert clock["sleeps"] == []
+    acquire_all(limiter, 1)
+    assert clock["sleeps"] == pytest.approx([30])
+
+
+def test_refill_is_capped_at_max_calls(clock):
+    limiter = GeminiRateLimiter(max_calls=2, time_window=60)
+    clock["now"] += 3600
+    acquire_all(limiter, 3)
+    assert clock["sleeps"] == pytest.approx([30])
@@ -0,0 +1,65 @@
+"""
+Tests for the per-client session store
+"""
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "clinical_orchestrator"))
+
+import sessions
+from sessions import SessionStore
+
+
+class FakeOrchestrator:
+    """Stands in for DocWeaverOrchestrator, which would build a Gemini model"""
+
+
+def make_store(monkeypatch, **kwargs):
+    monkeypatch.setattr(sessions, "DocWeaverOrchestrator", FakeOrchestrator)
+    return SessionStore(**kwargs)
+
+
+def test_same_session_gets_the_same_orchestrator(monkeypatch):
+    store = make_store(monkeypatch)
+    first = store.get("a")
+    assert store.get("a") is first
+    assert store.get("b") is not first
+    assert store.get_stats()["active_sessions"] == 2
+
+
+def test_discard_starts_a_fresh_session(monkeypatch):
+    store = make_store(monkeypatch)
+    first = store.get("a")
+    store.discard("a")
+    store.discard("missing")
+    assert store.get("a") is not first
+
+
+def test_least_recently_used_session_is_evicted_when_full(monkeypatch):
+    store = make_store(monkeypatch, max_sessions=2)
+    a = store.get("a")
+    b = store.get("b")
+    store.get("a")  # "b" is now least recently used
+    store.get("c")
+    assert store.get_stats()["active_sessions"] == 2
+    assert store.get("a") is a
+    assert store.get("b") is not b
+
+
+def test_idle_sessions_expire(monkeypatch):
+    store = make_store(monkeypatch, ttl=60)
+    now = time.monotonic()
+    monkeypatch.setattr(sessions.time, "monotonic", lambda: now)
+    first = store.get("a")
+    
+    monkeypatch.setattr(sessions.time, "monotonic", lambda: now + 30)
+    assert store.get("a") is first  # Touching a session extends its TTL
+    
+    monkeypatch.setattr(sessions.time, "monotonic", lambda: now + 89)
+    assert store.get("a") is first
+    
+    monkeypatch.setattr(sessions.time, "monotonic", lambda: now + 150)
+    assert store.get("b") is not None
+    assert store.get_stats()["active_sessions"] == 1
+    assert store.get("a") is not first